@@ -0,0 +1,53 @@
+# analytics.py
+# Lazy, columnar queries over the per-day CSV files (isplate_YYYY_MM_DD.csv), e.g.:
+#   totals(by=('primatelj', 'oib'), start=datetime.date(2024, 1, 1), ekonomska_klasifikacija='3237')
+import os
+import sys
+import polars as pl
+from schema import CSV_COLUMNS, KLASIFIKACIJE
+from csv_archive import day_files
+
+# ─── CONFIG ─────────────────────────────────────────────────────────────────────────
+CSV_DIR = os.getenv("CSV_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "csvs"))
+FILTER_COLUMNS = ("primatelj", "oib", *KLASIFIKACIJE)
+# ────────────────────────────────────────────────────────────────────────────────────
+
+def scan(csv_dir=CSV_DIR, start=None, end=None, **filters) -> pl.LazyFrame:
+    """LazyFrame over the selected day files with snake_case columns.
+
+    Keyword filters on primatelj/oib/classification columns take a value or a list of values
+    and are pushed down into the CSV scan. datum comes from the file name.
+    """
+    for column in filters:
+        if column not in FILTER_COLUMNS:
+            raise ValueError(f"Cannot filter on {column}, use one of {FILTER_COLUMNS}")
+    files = day_files(csv_dir, start, end)  # pruned by the date in the file name
+    if not files:
+        return pl.LazyFrame(schema={**{c: pl.String for c in CSV_COLUMNS.values()},
+                                    "datum": pl.Date, "iznos_na_poziciji": pl.Float64})
+    # All columns as strings: day files infer differently (e.g. empty OIB columns)
+    lf = pl.scan_csv(files, separator=";", infer_schema=False, include_file_paths="_path")
+    lf = lf.rename(CSV_COLUMNS, strict=False).with_columns(
+        pl.col("_path").str.extract(r"isplate_(\d{4}_\d{2}_\d{2})\.csv$").str.to_date("%Y_%m_%d").alias("datum"),
+        pl.col("iznos_na_poziciji").cast(pl.Float64),  # strict: an unparseable amount fails the query
+    ).drop("_path")
+    for column, value in filters.items():
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        lf = lf.filter(pl.col(column).is_in([str(v) for v in values]))
+    return lf
+
+def totals(by=("datum",), csv_dir=CSV_DIR, start=None, end=None, **filters) -> pl.DataFrame:
+    """Count and sum of iznos_na_poziciji grouped by `by`, largest sums first (streaming engine)."""
+    return (
+        scan(csv_dir, start, end, **filters)
+        .group_by(list(by))
+        .agg(pl.len().alias("broj_isplata"), pl.col("iznos_na_poziciji").sum().alias("iznos"))
+        .sort("iznos", descending=True)
+        .collect(engine="streaming")
+    )
+
+if __name__ == "__main__":
+    # python analytics.py [csv_dir] -> top recipients over all history
+    csv_dir = sys.argv[1] if len(sys.argv) > 1 else CSV_DIR
+    with pl.Config(tbl_rows=20):
+        print(totals(by=("primatelj", "oib"), csv_dir=csv_dir).head(20))
@@ -0,0 +1,109 @@
+# benchmarks.py
+# Manual benchmarks, e.g.:
+#   python benchmarks.py star_schema <csv_dir>
+#   python benchmarks.py write_modes <csv_dir> <YYYY-MM-DD> <YYYY-MM-DD>
+import os
+import sys
+import glob
+import time
+import datetime
+import tempfile
+import sqlalchemy as db
+
+# Scratch target for benchmark_write_modes (never the production dataset)
+BENCH_DATASET = "transparentnost_benchmark"
+BENCH_TABLE = "isplate_master"
+BENCH_ARCHIVE_PREFIX = "benchmark/raw/"
+
+def _best_of(fn, repeat=5):
+    """Best wall-clock time of fn() over `repeat` runs, in seconds."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def benchmark_star_schema(csv_dir, repeat=5):
+    """Load the same day files into a flat and a star-schema SQLite database and compare
+    ingest time, file size and a few typical group-by queries."""
+    from database import DBHandler
+    files = sorted(glob.glob(os.path.join(csv_dir, 'isplate_*.csv')))
+    queries = {
+        'po danu': "SELECT datum, SUM(iznos_na_poziciji) FROM {t} GROUP BY datum",
+        'po primatelju': "SELECT primatelj, SUM(iznos_na_poziciji) AS s FROM {t} GROUP BY primatelj ORDER BY s DESC LIMIT 20",
+        'po ekonomskoj klas.': "SELECT ekonomska_klasifikacija, SUM(iznos_na_poziciji) FROM {t} GROUP BY ekonomska_klasifikacija",
+        'filter primatelj': "SELECT COUNT(*), SUM(iznos_na_poziciji) FROM {t} WHERE primatelj = (SELECT primatelj FROM {t} LIMIT 1)",
+    }
+    # The same questions asked on surrogate keys, joining the dimension only for the result
+    star_key_queries = {
+        'po primatelju': "SELECT d.vrijednost, f.s FROM (SELECT primatelj_id, SUM(iznos_na_poziciji) AS s "
+                         "FROM isplate_fact GROUP BY primatelj_id ORDER BY s DESC LIMIT 20) f "
+                         "JOIN dim_primatelj d ON d.id = f.primatelj_id",
+        'po ekonomskoj klas.': "SELECT d.vrijednost, f.s FROM (SELECT ekonomska_klasifikacija_id AS k, "
+                               "SUM(iznos_na_poziciji) AS s FROM isplate_fact GROUP BY k) f "
+                               "JOIN dim_ekonomska_klasifikacija d ON d.id = f.k",
+    }
+    print(f"--- Star schema vs flat: {len(files)} day files from {csv_dir} ---")
+    with tempfile.TemporaryDirectory() as tmp:
+        for star_schema in (False, True):
+            layout = 'star' if star_schema else 'flat'
+            path = os.path.join(tmp, f'{layout}.db')
+            handler = DBHandler(db_path=path, star_schema=star_schema)
+            start = time.perf_counter()
+            for f in files:
+                handler.store_csv_data(f)
+            load_time = time.perf_counter() - start
+            handler.session.close()
+            print(f"[{layout}] ingest: {load_time:.2f} s | size: {os.path.getsize(path) / 1024 / 1024:.2f} MB")
+
+            table = 'isplate_flat' if star_schema else 'isplate'
+            timed = {name: sql.format(t=table) for name, sql in queries.items()}
+            if star_schema:
+                timed.update({f'{name} (ključevi)': sql for name, sql in star_key_queries.items()})
+            with handler.db_engine.connect() as conn:
+                for name, sql in timed.items():
+                    elapsed = _best_of(lambda: conn.execute(db.text(sql)).fetchall(), repeat)
+                    print(f"[{layout}] {name}: {elapsed * 1000:.1f} ms")
+            handler.db_engine.dispose()
+
+def _scratch_table(dataset, table):
+    """Create dataset.table (if missing) with the production table's schema and partitioning."""
+    from google.cloud import bigquery
+    from bq_handler import PROJECT, DATASET, TABLE
+    if dataset == DATASET:
+        raise ValueError(f"Refusing to benchmark in the production dataset {DATASET}")
+    client = bigquery.Client(project=PROJECT)
+    prod = client.get_table(bigquery.DatasetReference(PROJECT, DATASET).table(TABLE))
+    client.create_dataset(bigquery.Dataset(bigquery.DatasetReference(PROJECT, dataset)), exists_ok=True)
+    scratch = bigquery.Table(bigquery.DatasetReference(PROJECT, dataset).table(table), schema=prod.schema)
+    scratch.time_partitioning = prod.time_partitioning
+    client.create_table(scratch, exists_ok=True)
+
+def benchmark_write_modes(csv_dir, start, end, concurrency=1, dataset=BENCH_DATASET, table=BENCH_TABLE):
+    """Replay the same days into a scratch BigQuery table with load jobs and with the
+    Storage Write API. The scratch dataset also gets its own watermark/summary tables,
+    and archives go under BENCH_ARCHIVE_PREFIX, so production data is never touched."""
+    from bq_handler import BQHandler
+    from replay import replay
+    _scratch_table(dataset, table)
+    results = {}
+    for mode in ('load', 'storage_write'):
+        print(f"[{mode}] -> {dataset}.{table}")
+        handler = BQHandler(write_mode=mode, dataset=dataset, table=table, archive_prefix=BENCH_ARCHIVE_PREFIX)
+        results[mode] = replay(start, end, csv_dir, handler, concurrency)
+    for mode, stats in results.items():
+        print(f"[{mode}] {stats['seconds']} s | {stats['rows_per_s']} rows/s | "
+              f"{stats['jobs_per_s']} days/s | {len(stats['failures'])} failed")
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("Usage: python benchmarks.py star_schema <csv_dir>\n"
+              "       python benchmarks.py write_modes <csv_dir> <YYYY-MM-DD> <YYYY-MM-DD>")
+        sys.exit(1)
+    if sys.argv[1] == 'star_schema':
+        from __init__ import DOWNLOAD_DIR
+        benchmark_star_schema(sys.argv[2] if len(sys.argv) > 2 else DOWNLOAD_DIR)
+    elif sys.argv[1] == 'write_modes':
+        benchmark_write_modes(sys.argv[2], *(datetime.date.fromisoformat(d) for d in sys.argv[3:5]))
@@ -1,48 +1,275 @@
 # bq_handler.py
 import os
+import sys
+import gzip
+import hashlib
+import uuid
+import logging
 import datetime
+import threading
 from google.cloud import bigquery, storage
+from schema import AGGREGATES
 
 # ─── CONFIG ─────────────────────────────────────────────────────────────────────────
 PROJECT    = "zagreb-viz"
 DATASET    = "transparentnost"
 TABLE      = "isplate_master"
 CSV_BUCKET = "zagreb-viz-raw-csvs"  # or None to skip archiving
+LOAD_FROM_GCS = True                # archive to CSV_BUCKET first, then load from the gs:// URI
+ARCHIVE_PREFIX = "raw/"             # archived objects: <prefix><name>.csv
+ARCHIVE_GZIP  = False               # gzip the archived object (raw/<name>.csv.gz)
+UPLOAD_CHUNK  = 8 * 1024 * 1024     # streaming upload chunk (multiple of 256 KB)
+WATERMARK_TABLE = "isplate_watermark"   # per-day row counts and load timestamps
+WATERMARK_LABEL = "last_loaded_date"    # label on TABLE, value like "2025_05_01"
+WRITE_MODE = os.getenv("BQ_WRITE_MODE", "load")  # "load" (load jobs) or "storage_write" (Storage Write API)
+STAGING_TTL = datetime.timedelta(hours=24)        # staging tables left behind by a failed load expire
 # ────────────────────────────────────────────────────────────────────────────────────
 
+WATERMARK_SCHEMA = [
+    bigquery.SchemaField("datum", "DATE", mode="REQUIRED"),
+    bigquery.SchemaField("row_count", "INT64"),
+    bigquery.SchemaField("loaded_at", "TIMESTAMP"),
+]
+
+logger = logging.getLogger(__name__)
+
 class BQHandler:
-    def __init__(self):
-        self.client = bigquery.Client(project=PROJECT)
-        table_ref = self.client.dataset(DATASET).table(TABLE)
-        self.table = self.client.get_table(table_ref)
-        if CSV_BUCKET:
-            self.storage = storage.Client(project=PROJECT)
-            self.bucket  = self.storage.bucket(CSV_BUCKET)
-
-    def get_last_date(self) -> datetime.date:
+    def __init__(self, write_mode=WRITE_MODE, client=None, bucket=None,
+                 dataset=DATASET, table=TABLE, archive_prefix=ARCHIVE_PREFIX):
+        """client/bucket replace the BigQuery client and the CSV_BUCKET bucket
+        (replay.py passes local stand-ins); by default the real ones are created.
+        dataset/table/archive_prefix point the handler elsewhere, e.g. at a scratch table
+        (its watermark and summary tables live in the same dataset)."""
+        if write_mode not in ("load", "storage_write"):
+            raise ValueError(f"Unknown write mode: {write_mode}")
+        self.write_mode = write_mode
+        self._storage_writer = None
+        self.dataset, self.table_id, self.archive_prefix = dataset, table, archive_prefix
+        self.client = client or bigquery.Client(project=PROJECT)
+        self.table = self.client.get_table(self._table_ref(table))
+        self._watermark_ready = False
+        self._aggregates_ready = False
+        self._label_lock = threading.Lock()  # load_csv may run from several threads (replay.py)
+        self._pending_last_date = None       # loaded, label not yet advanced (flush_last_date_label)
+        # BigQuery aborts concurrent transactions that mutate the same table, so the per-day
+        # swaps run one at a time; only the staging loads run in parallel
+        self._finish_lock = threading.Lock()
+        if bucket is None and CSV_BUCKET:
+            bucket = storage.Client(project=PROJECT).bucket(CSV_BUCKET)
+        self.bucket = bucket  # None: no archiving
+
+    def _table_ref(self, name: str):
+        return bigquery.DatasetReference(PROJECT, self.dataset).table(name)
+
+    def _query(self, sql: str, params=None):
+        """Run a query with (name, type, value) parameters and wait for it."""
+        job_config = bigquery.QueryJobConfig(
+            query_parameters=[bigquery.ScalarQueryParameter(*p) for p in (params or [])]
+        )
+        return self.client.query(sql, job_config=job_config).result()
+
+    def _ensure_watermark_table(self):
+        if not self._watermark_ready:
+            table = bigquery.Table(self._table_ref(WATERMARK_TABLE), schema=WATERMARK_SCHEMA)
+            self.client.create_table(table, exists_ok=True)
+            self._watermark_ready = True
+
+    def _aggregate_select(self, group_cols, where=""):
+        cols = "".join(f"{c}, " for c in group_cols)
+        return (f"SELECT DATE(datum) AS datum, {cols}"
+                f"COUNT(*) AS broj_isplata, SUM(iznos_na_poziciji) AS iznos "
+                f"FROM `{PROJECT}.{self.dataset}.{self.table_id}` {where} "
+                f"GROUP BY {', '.join(str(i) for i in range(1, len(group_cols) + 2))}")
+
+    def _ensure_aggregate_tables(self):
+        """Create missing summary tables from the full history (one-off, no-op afterwards)."""
+        if not self._aggregates_ready:
+            self._query(" ".join(
+                f"CREATE TABLE IF NOT EXISTS `{PROJECT}.{self.dataset}.{name}` PARTITION BY datum "
+                f"AS {self._aggregate_select(cols)};"
+                for name, cols in AGGREGATES.items()
+            ))
+            self._aggregates_ready = True
+
+    def _delete_aggregates_sql(self):
+        return " ".join(
+            f"DELETE FROM `{PROJECT}.{self.dataset}.{name}` WHERE datum = @dt;" for name in AGGREGATES
+        )
+
+    def _refresh_aggregates_sql(self):
+        """Statements replacing the @dt slice of each summary table."""
+        inserts = " ".join(
+            f"INSERT INTO `{PROJECT}.{self.dataset}.{name}` (datum, {''.join(f'{c}, ' for c in cols)}broj_isplata, iznos) "
+            f"{self._aggregate_select(cols, 'WHERE DATE(datum) = @dt')};"
+            for name, cols in AGGREGATES.items()
+        )
+        return f"{self._delete_aggregates_sql()} {inserts}"
+
+    def refresh_aggregates(self, dt: datetime.date):
+        """Recompute only the dt slice of each summary table, atomically."""
+        self._ensure_aggregate_tables()
+        self._query(
+            f"BEGIN TRANSACTION; {self._refresh_aggregates_sql()} COMMIT TRANSACTION;",
+            [("dt", "DATE", dt)]
+        )
+
+    def get_last_date(self) -> datetime.datetime:
+        """Last loaded date, read from the table label (already fetched, no query job).
+        Falls back to a MAX(datum) scan if the label has not been written yet.
+        """
+        label = (self.table.labels or {}).get(WATERMARK_LABEL)
+        pending = self._pending_last_date
+        if label:
+            last = datetime.datetime.strptime(label, "%Y_%m_%d")
+            if pending and pending > last.date():
+                return datetime.datetime.combine(pending, datetime.time())
+            return last
+        return self.scan_last_date()
+
+    def scan_last_date(self) -> datetime.datetime:
         row = next(self.client.query(
             f"SELECT MAX(datum) AS last_date "
-            f"FROM `{PROJECT}.{DATASET}.{TABLE}`"
+            f"FROM `{PROJECT}.{self.dataset}.{self.table_id}`"
         ).result(), None)
         return row.last_date
 
+    def _set_last_date_label(self, dt: datetime.date, force=False):
+        """Advance the watermark label (never moves backwards unless force=True)."""
+        value = dt.strftime("%Y_%m_%d")
+        with self._label_lock:
+            labels = self.table.labels or {}
+            if force or labels.get(WATERMARK_LABEL, "") < value:
+                self.table.labels = {**labels, WATERMARK_LABEL: value}
+                self.table = self.client.update_table(self.table, ["labels"])
+
     def delete_date(self, dt: datetime.date):
-        job = self.client.query(
-            f"DELETE FROM `{PROJECT}.{DATASET}.{TABLE}` "
-            "WHERE DATE(datum) = @dt",
-            job_config=bigquery.QueryJobConfig(
-                query_parameters=[
-                    bigquery.ScalarQueryParameter("dt", "DATE", dt)
-                ]
-            )
+        """Remove rows for dt from the master table, its watermark entry and
+        its summary-table slices in one transaction."""
+        self._ensure_watermark_table()
+        self._ensure_aggregate_tables()
+        self._query(
+            "BEGIN TRANSACTION; "
+            f"DELETE FROM `{PROJECT}.{self.dataset}.{self.table_id}` WHERE DATE(datum) = @dt; "
+            f"DELETE FROM `{PROJECT}.{self.dataset}.{WATERMARK_TABLE}` WHERE datum = @dt; "
+            f"{self._delete_aggregates_sql()} "
+            "COMMIT TRANSACTION;",
+            [("dt", "DATE", dt)]
+        )
+
+    def flush_last_date_label(self):
+        """Advance the label to the last date loaded by this handler. Called once at the end
+        of a run rather than per day (table metadata updates are rate-limited); a failure is
+        only logged, since the data and the watermark table are already committed.
+        """
+        pending = self._pending_last_date
+        if not pending:
+            return
+        try:
+            self._set_last_date_label(pending)
+        except Exception as e:
+            # Kept pending (get_last_date still sees it); `verify --fix` resets the label from the table
+            logger.warning(f"Could not advance the {WATERMARK_LABEL} label to {pending}: {e}")
+            return
+        with self._label_lock:
+            if self._pending_last_date == pending:
+                self._pending_last_date = None
+
+    def _watermark_upsert_sql(self):
+        """Replace dt's watermark row (run inside a transaction; plain DML, so the local
+        stand-in in replay.py can run it too)."""
+        return (
+            f"DELETE FROM `{PROJECT}.{self.dataset}.{WATERMARK_TABLE}` WHERE datum = @dt; "
+            f"INSERT INTO `{PROJECT}.{self.dataset}.{WATERMARK_TABLE}` (datum, row_count, loaded_at) "
+            "VALUES (@dt, @row_count, CURRENT_TIMESTAMP());"
         )
-        job.result()
 
-    def load_csv(self, path: str, dt: datetime.date):
-        # 1) Remove existing rows for dt
-        self.delete_date(dt)
+    def _remember_last_date(self, dt: datetime.date):
+        with self._label_lock:
+            if self._pending_last_date is None or dt > self._pending_last_date:
+                self._pending_last_date = dt
+
+    def update_watermark(self, dt: datetime.date, row_count: int):
+        """Record the row count and load time for dt; the label follows in flush_last_date_label()."""
+        self._ensure_watermark_table()
+        self._query(f"BEGIN TRANSACTION; {self._watermark_upsert_sql()} COMMIT TRANSACTION;",
+                    [("dt", "DATE", dt), ("row_count", "INT64", row_count)])
+        self._remember_last_date(dt)
+
+    def _create_staging_table(self, dt: datetime.date):
+        """Empty, uniquely named copy of the master schema that receives one load attempt for dt."""
+        table_id = f"{self.table_id}_staging_{dt:%Y%m%d}_{uuid.uuid4().hex[:8]}"
+        staging = bigquery.Table(self._table_ref(table_id), schema=self.table.schema)
+        staging.expires = datetime.datetime.now(datetime.timezone.utc) + STAGING_TTL
+        return self.client.create_table(staging)
+
+    def _finish_load(self, dt: datetime.date, row_count: int, staging):
+        """Replace dt in one transaction script: the master rows (from the staging table),
+        the watermark row and dt's summary-table slices; the staging table is dropped after."""
+        staging_id = f"`{PROJECT}.{self.dataset}.{staging.table_id}`"
+        with self._finish_lock:
+            self._ensure_watermark_table()
+            self._ensure_aggregate_tables()
+            self._query(
+                "BEGIN TRANSACTION; "
+                f"DELETE FROM `{PROJECT}.{self.dataset}.{self.table_id}` WHERE DATE(datum) = @dt; "
+                f"INSERT INTO `{PROJECT}.{self.dataset}.{self.table_id}` SELECT * FROM {staging_id}; "
+                f"{self._watermark_upsert_sql()} {self._refresh_aggregates_sql()} "
+                f"COMMIT TRANSACTION; DROP TABLE IF EXISTS {staging_id};",
+                [("dt", "DATE", dt), ("row_count", "INT64", row_count)]
+            )
+        self._remember_last_date(dt)
+
+    def verify(self, fix=False):
+        """Reconcile the watermark table against per-day counts in the master table.
+        Returns a list of (datum, actual_rows, recorded_rows) mismatches.
+        With fix=True the watermark table and label are rewritten from the master table.
+        """
+        self._ensure_watermark_table()
+        actual = (f"SELECT DATE(datum) AS datum, COUNT(*) AS row_count "
+                  f"FROM `{PROJECT}.{self.dataset}.{self.table_id}` GROUP BY 1")
+        mismatches = [
+            (r.datum, r.actual, r.recorded) for r in self._query(
+                f"SELECT COALESCE(t.datum, w.datum) AS datum, t.row_count AS actual, w.row_count AS recorded "
+                f"FROM ({actual}) t FULL OUTER JOIN `{PROJECT}.{self.dataset}.{WATERMARK_TABLE}` w "
+                "ON t.datum = w.datum "
+                "WHERE t.row_count IS DISTINCT FROM w.row_count ORDER BY datum"
+            )
+        ]
+        if fix:
+            self._query(
+                f"MERGE `{PROJECT}.{self.dataset}.{WATERMARK_TABLE}` w USING ({actual}) t ON w.datum = t.datum "
+                "WHEN MATCHED AND w.row_count != t.row_count THEN "
+                "UPDATE SET row_count = t.row_count, loaded_at = CURRENT_TIMESTAMP() "
+                "WHEN NOT MATCHED BY TARGET THEN INSERT (datum, row_count, loaded_at) "
+                "VALUES (t.datum, t.row_count, CURRENT_TIMESTAMP()) "
+                "WHEN NOT MATCHED BY SOURCE THEN DELETE"
+            )
+            last = self.scan_last_date()
+            if last:
+                self._set_last_date_label(last, force=True)
+        return mismatches
 
-        # 2) Load with explicit schema and semicolon delimiter
+    def archive_csv(self, path: str) -> str:
+        """Stream the CSV into gs://CSV_BUCKET/<archive_prefix> in one pass, hashing (and optionally
+        gzipping) chunks on the way. Returns the gs:// URI of the archived object.
+        """
+        dest = f"{self.archive_prefix}{os.path.basename(path)}" + (".gz" if ARCHIVE_GZIP else "")
+        blob = self.bucket.blob(dest)
+        sha256 = hashlib.sha256()
+        content_type = "application/gzip" if ARCHIVE_GZIP else "text/csv"
+        with open(path, "rb") as src, blob.open("wb", chunk_size=UPLOAD_CHUNK, ignore_flush=True, content_type=content_type) as out:
+            sink = gzip.GzipFile(fileobj=out, mode="wb", mtime=0) if ARCHIVE_GZIP else out
+            for chunk in iter(lambda: src.read(UPLOAD_CHUNK), b""):
+                sha256.update(chunk)
+                sink.write(chunk)
+            if ARCHIVE_GZIP:
+                sink.close()  # writes the gzip trailer, leaves `out` open
+        blob.metadata = {"sha256": sha256.hexdigest()}
+        blob.patch()
+        return f"gs://{self.bucket.name}/{dest}"
+
+    def _run_load_job(self, path: str, staging) -> int:
+        """Load the CSV into the staging table with a load job."""
         job_config = bigquery.LoadJobConfig(
             schema=self.table.schema,
             source_format=bigquery.SourceFormat.CSV,
@@ -50,21 +277,65 @@ class BQHandler:
             field_delimiter=';',                               # ← add this
             write_disposition=bigquery.WriteDisposition.WRITE_APPEND
         )
-        with open(path, "rb") as f:
-            load_job = self.client.load_table_from_file(
-                f, self.table.reference, job_config=job_config
+        if self.bucket and LOAD_FROM_GCS:
+            # Single upload: the archived object is also the load job's source
+            uri = self.archive_csv(path)
+            load_job = self.client.load_table_from_uri(
+                uri, staging.reference, job_config=job_config
             )
+        else:
+            with open(path, "rb") as f:
+                load_job = self.client.load_table_from_file(
+                    f, staging.reference, job_config=job_config
+                )
         load_job.result()
+        return load_job.output_rows
+
+    def _write_storage_api(self, path: str, dt: datetime.date, staging) -> int:
+        """Write the CSV into the staging table through a pending Storage Write stream (no load job)."""
+        from bq_storage_writer import StorageWriter  # needs google-cloud-bigquery-storage + pyarrow
+        if self._storage_writer is None:
+            self._storage_writer = StorageWriter()
+        return self._storage_writer.write_day(path, dt, staging)
+
+    def load_csv(self, path: str, dt: datetime.date) -> int:
+        """Replace dt in the master table with the CSV's rows. Returns the number of rows loaded.
+        The master table only changes in the final transaction, so a failed or retried load
+        never leaves the day missing or doubled.
+        """
+        # 1) Write the rows into a fresh staging table
+        staging = self._create_staging_table(dt)
+        try:
+            if self.write_mode == "storage_write":
+                rows = self._write_storage_api(path, dt, staging)
+            else:
+                rows = self._run_load_job(path, staging)
+
+            # 2-4) Swap the day's master rows, watermark row and summary-table slices in one transaction
+            self._finish_load(dt, rows, staging)
+        except Exception:
+            try:
+                self.client.delete_table(staging, not_found_ok=True)
+            except Exception as e:  # expires after STAGING_TTL anyway
+                logger.warning(f"Could not drop staging table {staging.table_id}: {e}")
+            raise
 
-        # 3) Archive raw CSV if desired
-        if CSV_BUCKET:
-            dest = f"raw/{os.path.basename(path)}"
-            blob = self.bucket.blob(dest)
-            blob.upload_from_filename(path)
+        # 5) Archive raw CSV if desired (already done when loading from GCS)
+        if self.bucket and not (self.write_mode == "load" and LOAD_FROM_GCS):
+            self.archive_csv(path)
+        return rows
 
 if __name__ == "__main__":
     bqh = BQHandler()
-    last_date = bqh.get_last_date()
-    print(f"Last date in BQ: {last_date}")
+    if len(sys.argv) > 1 and sys.argv[1] == "verify":
+        # python bq_handler.py verify [--fix]
+        fix = "--fix" in sys.argv
+        mismatches = bqh.verify(fix=fix)
+        for datum, actual, recorded in mismatches:
+            print(f"{datum}: table={actual} watermark={recorded}")
+        print(f"{len(mismatches)} mismatched dates{' (fixed)' if fix and mismatches else ''}")
+    else:
+        last_date = bqh.get_last_date()
+        print(f"Last date in BQ: {last_date}")
     #test_csv_file = "C://Users//grand//OneDrive//ZagrebVIz//transparentnost_scraper//csvs//isplate_2024_01_02.csv"
-    #bqh.load_csv(test_csv_file, datetime.date(2024, 1, 2))
\ No newline at end of file
+    #bqh.load_csv(test_csv_file, datetime.date(2024, 1, 2))
@@ -0,0 +1,87 @@
+# bq_storage_writer.py
+# BigQuery Storage Write API path for BQHandler (WRITE_MODE = "storage_write")
+import datetime
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+from google.cloud.bigquery_storage_v1 import BigQueryWriteClient, types
+
+# ─── CONFIG ─────────────────────────────────────────────────────────────────────────
+BATCH_ROWS = 20000  # rows per AppendRows request (each request must stay under 10 MB)
+TIMESTAMP_FORMATS = [pa_csv.ISO8601, "%d.%m.%Y.", "%d.%m.%Y", "%d.%m.%Y. %H:%M:%S"]
+# ────────────────────────────────────────────────────────────────────────────────────
+
+ARROW_TYPES = {
+    "STRING": pa.string(),
+    "INTEGER": pa.int64(), "INT64": pa.int64(),
+    "FLOAT": pa.float64(), "FLOAT64": pa.float64(),
+    "NUMERIC": pa.decimal128(38, 9),
+    "BOOLEAN": pa.bool_(), "BOOL": pa.bool_(),
+    "DATE": pa.date32(),
+    "DATETIME": pa.timestamp("us"),
+    "TIMESTAMP": pa.timestamp("us", tz="UTC"),
+}
+
+def arrow_schema(bq_schema) -> pa.Schema:
+    return pa.schema([
+        pa.field(f.name, ARROW_TYPES[f.field_type], nullable=f.mode != "REQUIRED") for f in bq_schema
+    ])
+
+def read_csv_arrow(path: str, bq_schema) -> pa.Table:
+    """Parse a semicolon-delimited export into an Arrow table in the BigQuery column order/types."""
+    schema = arrow_schema(bq_schema)
+    # DATE columns are read as timestamps (so the same formats apply) and cast afterwards
+    read_types = {
+        f.name: pa.timestamp("s") if pa.types.is_date(f.type) else f.type for f in schema
+    }
+    table = pa_csv.read_csv(
+        path,
+        read_options=pa_csv.ReadOptions(column_names=schema.names, skip_rows=1),
+        parse_options=pa_csv.ParseOptions(delimiter=";"),
+        # Empty fields become NULL, as in a load job (whose default null marker is the empty string)
+        convert_options=pa_csv.ConvertOptions(column_types=read_types, timestamp_parsers=TIMESTAMP_FORMATS,
+                                               strings_can_be_null=True),
+    )
+    return table.cast(schema)
+
+class StorageWriter:
+    """Writes one day per PENDING write stream: rows are appended with explicit offsets
+    (retried appends cannot duplicate) and become visible only at the atomic commit.
+    """
+
+    def __init__(self):
+        self.client = BigQueryWriteClient()
+
+    def _requests(self, stream_name, table: pa.Table):
+        serialized_schema = table.schema.serialize().to_pybytes()
+        offset = 0
+        for i, batch in enumerate(table.to_batches(max_chunksize=BATCH_ROWS)):
+            arrow_rows = types.AppendRowsRequest.ArrowData(
+                rows=types.ArrowRecordBatch(serialized_record_batch=batch.serialize().to_pybytes())
+            )
+            if i == 0:  # schema and stream are only required on the first request
+                arrow_rows.writer_schema = types.ArrowSchema(serialized_schema=serialized_schema)
+            yield types.AppendRowsRequest(write_stream=stream_name, offset=offset, arrow_rows=arrow_rows)
+            offset += batch.num_rows
+
+    def write_day(self, path: str, dt: datetime.date, bq_table) -> int:
+        """Stream the CSV's rows into a pending stream on bq_table (BQHandler passes a
+        staging table) and commit them atomically. Returns the row count.
+        """
+        parent = self.client.table_path(bq_table.project, bq_table.dataset_id, bq_table.table_id)
+        table = read_csv_arrow(path, bq_table.schema)
+        stream = self.client.create_write_stream(
+            parent=parent,
+            write_stream=types.WriteStream(type_=types.WriteStream.Type.PENDING),
+        )
+        if table.num_rows:
+            for response in self.client.append_rows(iter(self._requests(stream.name, table))):
+                if response.error.code or response.row_errors:
+                    raise RuntimeError(f"Storage Write append failed for {dt}: "
+                                       f"{response.error.message or list(response.row_errors)}")
+        self.client.finalize_write_stream(name=stream.name)
+        commit = self.client.batch_commit_write_streams(
+            types.BatchCommitWriteStreamsRequest(parent=parent, write_streams=[stream.name])
+        )
+        if commit.stream_errors:
+            raise RuntimeError(f"Storage Write commit failed for {dt}: {list(commit.stream_errors)}")
+        return table.num_rows
@@ -0,0 +1,15 @@
+# conftest.py
+# database.py reads DB_PATH/DOWNLOAD_DIR from the local, untracked __init__.py; the tests pass
+# their own db_path, so without that file a placeholder config is enough to import it.
+import os
+import sys
+import types
+import tempfile
+
+try:
+    import __init__  # noqa: F401
+except ImportError:
+    config = types.ModuleType("__init__")
+    config.DOWNLOAD_DIR = tempfile.gettempdir()
+    config.DB_PATH = os.path.join(config.DOWNLOAD_DIR, "transparentnost_test.db")
+    sys.modules["__init__"] = config
@@ -0,0 +1,157 @@
+# csv_archive.py
+import os
+import re
+import sys
+import glob
+import mmap
+import struct
+import datetime
+
+# ─── CONFIG ─────────────────────────────────────────────────────────────────────────
+ZSTD_LEVEL = 10
+INDEX_MAGIC = b"ISPLIDX1"
+# date ordinal, block offset, compressed length, raw length
+INDEX_ENTRY = struct.Struct("<iQII")
+# ────────────────────────────────────────────────────────────────────────────────────
+
+CSV_NAME_RE = re.compile(r"isplate_(\d{4}_\d{2}_\d{2})\.csv$")
+
+def date_from_filename(path: str):
+    """datetime.date from an isplate_YYYY_MM_DD.csv name, or None."""
+    match = CSV_NAME_RE.search(os.path.basename(path))
+    return datetime.datetime.strptime(match.group(1), "%Y_%m_%d").date() if match else None
+
+def day_files(csv_dir: str, start: datetime.date = None, end: datetime.date = None):
+    """isplate_YYYY_MM_DD.csv files in csv_dir with dates in [start, end], in date order
+    (pruned by file name, nothing is opened)."""
+    # datetime bounds (used around the scraper) compare by their date
+    start = start.date() if isinstance(start, datetime.datetime) else start
+    end = end.date() if isinstance(end, datetime.datetime) else end
+    files = []
+    for path in glob.glob(os.path.join(csv_dir, "isplate_*.csv")):
+        dt = date_from_filename(path)
+        if dt and (start is None or dt >= start) and (end is None or dt <= end):
+            files.append((dt, path))
+    return [path for _, path in sorted(files)]
+
+class CsvArchive:
+    """Append-only single-file archive of the daily CSV exports.
+
+    <path>.zst holds one zstd frame per day, <path>.idx holds fixed-size
+    (date, offset, length, raw length) entries. A re-archived day is appended
+    again and the later index entry wins. Reads go through a memory map and
+    decompress only the requested blocks.
+    """
+
+    def __init__(self, path: str):
+        import zstandard  # here, so the date helpers above work without it
+        self.data_path = path + ".zst"
+        self.index_path = path + ".idx"
+        self.index = self._read_index()  # date -> (offset, length, raw_length)
+        self._mmap = None
+        self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+        self._decompressor = zstandard.ZstdDecompressor()
+
+    def _read_index(self):
+        index = {}
+        if not os.path.exists(self.index_path):
+            return index  # created by the first append()
+        with open(self.index_path, "rb") as f:
+            if f.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+                raise ValueError(f"Not a CSV archive index: {self.index_path}")
+            data = f.read()
+        # A torn trailing entry (crash mid-write) is ignored
+        usable = len(data) - len(data) % INDEX_ENTRY.size
+        for ordinal, offset, length, raw_length in INDEX_ENTRY.iter_unpack(data[:usable]):
+            index[datetime.date.fromordinal(ordinal)] = (offset, length, raw_length)
+        return index
+
+    def _view(self):
+        if self._mmap is None:
+            with open(self.data_path, "rb") as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def dates(self):
+        return sorted(self.index)
+
+    def __contains__(self, dt):
+        return dt in self.index
+
+    def append(self, dt: datetime.date, csv_bytes: bytes):
+        """Append one day's CSV. Data is written and synced before its index entry."""
+        block = self._compressor.compress(csv_bytes)
+        os.makedirs(os.path.dirname(os.path.abspath(self.data_path)), exist_ok=True)
+        with open(self.data_path, "ab") as f:
+            offset = f.tell()
+            f.write(block)
+            f.flush()
+            os.fsync(f.fileno())
+        with open(self.index_path, "ab") as f:
+            if f.tell() == 0:
+                f.write(INDEX_MAGIC)
+            f.write(INDEX_ENTRY.pack(dt.toordinal(), offset, len(block), len(csv_bytes)))
+        self.index[dt] = (offset, len(block), len(csv_bytes))
+        self.close()  # the map no longer covers the whole file
+
+    def append_csv(self, path: str, dt: datetime.date = None):
+        dt = dt or date_from_filename(path)
+        if dt is None:
+            raise ValueError(f"Cannot tell the date of {path}")
+        with open(path, "rb") as f:
+            self.append(dt, f.read())
+
+    def read_day(self, dt: datetime.date) -> bytes:
+        offset, length, raw_length = self.index[dt]
+        return self._decompressor.decompress(self._view()[offset:offset + length], max_output_size=raw_length)
+
+    def read_range(self, start: datetime.date = None, end: datetime.date = None):
+        """Yield (date, csv_bytes) for archived days in [start, end], in date order."""
+        for dt in self.dates():
+            if (start is None or dt >= start) and (end is None or dt <= end):
+                yield dt, self.read_day(dt)
+
+    def import_csv_dir(self, csv_dir: str, replace=False):
+        """Archive every isplate_YYYY_MM_DD.csv in csv_dir (skipping archived days unless replace)."""
+        imported = 0
+        for path in day_files(csv_dir):
+            dt = date_from_filename(path)
+            if replace or dt not in self.index:
+                self.append_csv(path, dt)
+                imported += 1
+        return imported
+
+    def export_csv_dir(self, csv_dir: str, start: datetime.date = None, end: datetime.date = None):
+        """Write archived days back out as isplate_YYYY_MM_DD.csv files."""
+        os.makedirs(csv_dir, exist_ok=True)
+        exported = 0
+        for dt, csv_bytes in self.read_range(start, end):
+            with open(os.path.join(csv_dir, f"isplate_{dt.strftime('%Y_%m_%d')}.csv"), "wb") as f:
+                f.write(csv_bytes)
+            exported += 1
+        return exported
+
+if __name__ == "__main__":
+    # python csv_archive.py import <csv_dir> <archive_path>
+    # python csv_archive.py export <csv_dir> <archive_path> [YYYY-MM-DD YYYY-MM-DD]
+    # python csv_archive.py ls <archive_path>
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "import":
+        archive = CsvArchive(sys.argv[3])
+        print(f"Imported {archive.import_csv_dir(sys.argv[2])} days into {archive.data_path}")
+    elif command == "export":
+        archive = CsvArchive(sys.argv[3])
+        start, end = (datetime.date.fromisoformat(d) for d in sys.argv[4:6]) if len(sys.argv) > 5 else (None, None)
+        print(f"Exported {archive.export_csv_dir(sys.argv[2], start, end)} days to {sys.argv[2]}")
+    elif command == "ls":
+        archive = CsvArchive(sys.argv[2])
+        for dt in archive.dates():
+            offset, length, raw_length = archive.index[dt]
+            print(f"{dt}  {length:>10} B  (raw {raw_length} B)")
+    else:
+        print("Usage: python csv_archive.py import|export|ls ...")
@@ -0,0 +1,56 @@
+import os
+import datetime
+from csv_archive import CsvArchive, INDEX_MAGIC, INDEX_ENTRY, day_files
+
+D1, D2, D3 = datetime.date(2024, 1, 2), datetime.date(2024, 1, 3), datetime.date(2024, 1, 4)
+
+def test_append_and_read_round_trip(tmp_path):
+    archive = CsvArchive(str(tmp_path / 'arch'))
+    archive.append(D1, b'Datum;Iznos\n2024-01-02;1,00\n')
+    archive.append(D2, 'Primatelj\nČistoća\n'.encode('utf-8'))
+    reopened = CsvArchive(str(tmp_path / 'arch'))
+    assert reopened.dates() == [D1, D2]
+    assert reopened.read_day(D1) == b'Datum;Iznos\n2024-01-02;1,00\n'
+    assert reopened.read_day(D2).decode('utf-8') == 'Primatelj\nČistoća\n'
+    assert list(reopened.read_range(D2, D3)) == [(D2, reopened.read_day(D2))]
+
+def test_later_entry_wins(tmp_path):
+    archive = CsvArchive(str(tmp_path / 'arch'))
+    archive.append(D1, b'old')
+    archive.append(D1, b'new')
+    assert archive.read_day(D1) == b'new'
+    assert CsvArchive(str(tmp_path / 'arch')).read_day(D1) == b'new'
+
+def test_torn_trailing_index_entry_is_ignored(tmp_path):
+    archive = CsvArchive(str(tmp_path / 'arch'))
+    archive.append(D1, b'day one')
+    archive.append(D2, b'day two')
+    with open(archive.index_path, 'r+b') as f:  # crash halfway through writing the last entry
+        f.truncate(len(INDEX_MAGIC) + INDEX_ENTRY.size + INDEX_ENTRY.size // 2)
+    reopened = CsvArchive(str(tmp_path / 'arch'))
+    assert reopened.dates() == [D1]
+    assert reopened.read_day(D1) == b'day one'
+
+def test_opening_does_not_create_files(tmp_path):
+    archive = CsvArchive(str(tmp_path / 'missing' / 'arch'))
+    assert archive.dates() == []
+    assert not os.path.exists(tmp_path / 'missing')
+
+def test_import_and_export_csv_dir(tmp_path):
+    src, out = tmp_path / 'csvs', tmp_path / 'out'
+    src.mkdir()
+    for dt in (D1, D2, D3):
+        (src / f"isplate_{dt:%Y_%m_%d}.csv").write_bytes(f'{dt}\n'.encode())
+    (src / 'notes.csv').write_bytes(b'ignored')
+    archive = CsvArchive(str(tmp_path / 'arch'))
+    assert archive.import_csv_dir(str(src)) == 3
+    assert archive.import_csv_dir(str(src)) == 0  # already archived
+    assert archive.export_csv_dir(str(out), D2, D3) == 2
+    assert sorted(os.listdir(out)) == ['isplate_2024_01_03.csv', 'isplate_2024_01_04.csv']
+    assert (out / 'isplate_2024_01_04.csv').read_bytes() == b'2024-01-04\n'
+
+def test_day_files_accepts_datetime_bounds(tmp_path):
+    for dt in (D1, D2, D3):
+        (tmp_path / f"isplate_{dt:%Y_%m_%d}.csv").write_bytes(b'')
+    files = day_files(str(tmp_path), start=datetime.datetime(2024, 1, 3), end=datetime.datetime(2024, 1, 4, 12))
+    assert [os.path.basename(f) for f in files] == ['isplate_2024_01_03.csv', 'isplate_2024_01_04.csv']
@@ -0,0 +1,208 @@
+# daemon.py
+# Long-running scheduler mode: one warm browser, probes each pending date around the time
+# the city usually publishes it and loads it as soon as it appears. Run with: python daemon.py
+import os
+import json
+import time
+import logging
+import datetime
+import statistics
+import traceback
+from google.cloud import storage
+from transparentnost_scraper import (
+    TransparentnostScraper, DriverManager, alert_slack, log_handler, LOG_DIR, PRODUCTION
+)
+
+# ─── CONFIG ─────────────────────────────────────────────────────────────────────────
+PUBLICATION_HISTORY = os.getenv("PUBLICATION_HISTORY", os.path.join(LOG_DIR, "publication_history.json"))
+STATE_BUCKET = os.getenv("STATE_BUCKET", "zagreb-viz-raw-csvs" if PRODUCTION else "")  # "" = local only
+STATE_BLOB = "state/publication_history.json"
+HISTORY_SIZE = 200           # observations kept
+DEFAULT_DELAY_H = 18         # expected publication (hours after the payout day's midnight) until learned
+PROBE_LEAD_MIN = 60          # start probing this long before the expected time
+PROBE_INTERVAL_MIN = 5       # probe interval around the expected time
+PROBE_WINDOW_H = 4           # ... for this long after it
+IDLE_INTERVAL_MIN = 60       # probe interval outside the window
+ERROR_BACKOFF_MIN = 5        # retry delay after a failed probe (browser/site down), doubled per failure
+MAX_BACKOFF_MIN = 60         # ... up to this
+# ────────────────────────────────────────────────────────────────────────────────────
+
+logger = logging.getLogger(__name__)
+
+def _midnight(dt: datetime.date):
+    return datetime.datetime.combine(dt, datetime.time())
+
+class PublicationModel:
+    """Learns when each date's data gets published: the delay between the payout date's
+    midnight and the first probe that found it right after a miss, median per weekday
+    (all days as fallback). Dates found on their first probe say nothing about publication time.
+    """
+
+    def __init__(self, path=PUBLICATION_HISTORY):
+        self.path = path
+        self.bucket = storage.Client(project="zagreb-viz").bucket(STATE_BUCKET) if STATE_BUCKET else None
+        self.observations = self._load()  # [{"date": ..., "seen_at": ...}]
+
+    def _load(self):
+        if not os.path.exists(self.path) and self.bucket:
+            blob = self.bucket.blob(STATE_BLOB)
+            if blob.exists():
+                blob.download_to_filename(self.path)
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        return []
+
+    def _save(self):
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(self.observations, f, indent=1)
+        if self.bucket:
+            try:
+                self.bucket.blob(STATE_BLOB).upload_from_filename(self.path)
+            except Exception as e:
+                logger.error(f"Failed to upload publication history: {e}")
+
+    def record(self, dt: datetime.date, seen_at: datetime.datetime):
+        self.observations.append({"date": dt.isoformat(), "seen_at": seen_at.isoformat(timespec="seconds")})
+        self.observations = self.observations[-HISTORY_SIZE:]
+        self._save()
+
+    def expected_at(self, dt: datetime.date) -> datetime.datetime:
+        delays = {}
+        for obs in self.observations:
+            obs_date = datetime.date.fromisoformat(obs["date"])
+            delay = datetime.datetime.fromisoformat(obs["seen_at"]) - _midnight(obs_date)
+            delays.setdefault(obs_date.weekday(), []).append(delay)
+        same_weekday = delays.get(dt.weekday())
+        every_day = [d for ds in delays.values() for d in ds]
+        if same_weekday or every_day:
+            delay = statistics.median(same_weekday or every_day)
+        else:
+            delay = datetime.timedelta(hours=DEFAULT_DELAY_H)
+        return _midnight(dt) + delay
+
+    def next_probe(self, dt: datetime.date, now: datetime.datetime) -> datetime.datetime:
+        """Sparse probing far from the expected time, dense probing around it."""
+        expected = self.expected_at(dt)
+        window_start = expected - datetime.timedelta(minutes=PROBE_LEAD_MIN)
+        window_end = expected + datetime.timedelta(hours=PROBE_WINDOW_H)
+        if now < window_start:
+            return min(window_start, now + datetime.timedelta(minutes=IDLE_INTERVAL_MIN))
+        if now < window_end:
+            return now + datetime.timedelta(minutes=PROBE_INTERVAL_MIN)
+        return now + datetime.timedelta(minutes=IDLE_INTERVAL_MIN)
+
+def _restart_browser(manager):
+    """Fresh browser session after a failed probe. If it cannot start either (Chromium or the
+    site down), the manager is left without a driver and the next probe starts one."""
+    try:
+        manager.recycle("probe error")
+    except Exception as e:
+        logger.error(f"Browser restart failed: {e}")
+        try:
+            manager.quit()
+        except Exception:
+            manager.driver = None
+
+def _probe(scraper, manager, dt, failures=0):
+    """Try to scrape and load one date with the warm browser.
+    True if it was loaded, False if it has no data yet, None if the probe itself failed."""
+    scraper.set_dates((dt, dt))
+    try:
+        scraper.webscrape(manager)
+        manager.day_done()
+    except Exception:
+        logger.error(f"Probe failed for {dt}:\n{traceback.format_exc()}")
+        if not failures:  # once per outage, not on every retry
+            alert_slack(f":red_circle: Daemon probe failed for {dt}\n```{traceback.format_exc()}```")
+        _restart_browser(manager)
+        return None
+    return dt in scraper.loaded_dates
+
+def run_daemon():
+    scraper = TransparentnostScraper()
+    scraper.probe_mode = True
+    model = PublicationModel()
+    manager = DriverManager()
+    next_probe = {}   # date -> when to probe it next
+    last_miss = {}    # date -> last probe that found no data
+    failures = 0      # consecutive failed probes
+    logger.info(" === Daemon started === ")
+    try:
+        while True:
+            now = datetime.datetime.now()
+            # Pending: every date after the last loaded one up to today. Dates before a loaded
+            # date drop out on their own (weekends/holidays never get data).
+            pending = []
+            dt = scraper.last_date_tbl + datetime.timedelta(days=1)
+            while dt <= datetime.date.today():
+                pending.append(dt)
+                dt += datetime.timedelta(days=1)
+            for dt in list(next_probe):
+                if dt not in pending:
+                    next_probe.pop(dt)
+                    last_miss.pop(dt, None)
+
+            for dt in pending:
+                if next_probe.get(dt, now) > now:
+                    continue
+                loaded = _probe(scraper, manager, dt, failures)
+                if loaded is None:
+                    # Not evidence about publication; back off and leave the other dates for later
+                    failures += 1
+                    backoff = min(ERROR_BACKOFF_MIN * 2 ** (failures - 1), MAX_BACKOFF_MIN)
+                    retry_at = datetime.datetime.now() + datetime.timedelta(minutes=backoff)
+                    next_probe[dt] = retry_at
+                    logger.info(f"Retrying {dt} in {backoff} min ({failures} failed probes in a row)")
+                    break
+                if failures:
+                    alert_slack(f":large_green_circle: Daemon probes work again after {failures} failures")
+                    failures = 0
+                if loaded:
+                    seen_at = datetime.datetime.now()
+                    scraper.last_date_tbl = max(scraper.last_date_tbl, dt)
+                    age = seen_at - _midnight(dt + datetime.timedelta(days=1))
+                    if dt in last_miss:
+                        # Published between the last miss and now: a usable observation
+                        model.record(dt, seen_at)
+                        lag = seen_at - last_miss[dt]
+                        lag_text = f"≤ {lag}"
+                    else:
+                        # Already there on the first probe (e.g. backlog after downtime)
+                        lag, lag_text = None, "unknown"
+                    logger.info(f"Freshness: {dt} loaded {age} after the payout day, "
+                                f"lag after publication {lag_text}",
+                                extra={'date': dt, 'stage': 'freshness',
+                                       'duration': lag.total_seconds() if lag else None})
+                    alert_slack(f":white_check_mark: Loaded {dt} | freshness lag {lag_text} | "
+                                f"browser RSS peak {manager.peak_rss_mb:.0f} MB")
+                    next_probe.pop(dt, None)
+                    last_miss.pop(dt, None)
+                else:
+                    last_miss[dt] = datetime.datetime.now()
+                    next_probe[dt] = model.next_probe(dt, last_miss[dt])
+
+            now = datetime.datetime.now()
+            wake = min(next_probe.values(), default=now + datetime.timedelta(minutes=IDLE_INTERVAL_MIN))
+            if failures:
+                wake = retry_at  # no other date either until the backoff has passed
+            sleep_s = max((wake - now).total_seconds(), 0)
+            if sleep_s:
+                logger.info(f"Next probe at {wake:%Y-%m-%d %H:%M} ({len(next_probe)} pending dates)")
+                time.sleep(sleep_s)
+    finally:
+        manager.quit()
+        logger.info(f"Daemon stopped. Browser peak RSS: {manager.peak_rss_mb:.0f} MB, "
+                    f"recycled {manager.recycles} times", extra={'stage': 'memory'})
+
+if __name__ == "__main__":
+    try:
+        run_daemon()
+    except Exception:
+        alert_slack(f":red_circle: Daemon failed:\n```{traceback.format_exc()}```")
+        raise
+    finally:
+        if PRODUCTION:
+            log_handler.upload_to_gcs()
+        else:
+            log_handler.stop()
@@ -1,10 +1,18 @@
 import os
+import unicodedata
 import pandas as pd
 import sqlalchemy as db
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker
 ####
 from __init__ import DB_PATH
+from schema import KLASIFIKACIJE, CSV_COLUMNS, DATE_COLUMNS, DIMENSIONS
+from query_cache import QueryCache, cached_query
+
+# Normalised storage: dimension tables + isplate_fact, read back through the isplate_flat view
+STAR_SCHEMA = False
+# Max number of cached query results per DBHandler (LRU)
+QUERY_CACHE_SIZE = 256
 
 #-------------------------------------------------------------------------------------------------
 #-----------DATABASE DEFINITION------------------------------------------------------
@@ -35,76 +43,360 @@ class Isplate(Base):
     iban = db.Column(db.String)
     poziv_na_broj = db.Column(db.String)
 
+#----------------STAR SCHEMA (STAR_SCHEMA=True)---------------------------------------------------
+def _dimension(column):
+    """Dimension table dim_<column>: integer surrogate key -> distinct string value."""
+    return type(f'Dim_{column}', (Base,), {
+        '__tablename__': f'dim_{column}',
+        'id': db.Column(db.Integer, primary_key=True),
+        'vrijednost': db.Column(db.String, unique=True),
+    })
+
+DIMENSION_MODELS = {column: _dimension(column) for column in DIMENSIONS}
+
+class IsplateFact(Base):
+    __tablename__ = 'isplate_fact'
+    row_number = db.Column(db.Integer, primary_key=True)
+    naziv_isplatitelja_id = db.Column(db.Integer, db.ForeignKey('dim_naziv_isplatitelja.id'))
+    datum = db.Column(db.Date, index=True)
+    primatelj_id = db.Column(db.Integer, db.ForeignKey('dim_primatelj.id'), index=True)
+    oib = db.Column(db.String)
+    mjesto_id = db.Column(db.Integer, db.ForeignKey('dim_mjesto.id'))
+    proracunski_korisnik_id = db.Column(db.Integer, db.ForeignKey('dim_proracunski_korisnik.id'))
+    valuta = db.Column(db.String)
+    iznos_na_poziciji = db.Column(db.Float)
+    pozicija = db.Column(db.String)
+    organizacijska_klasifikacija_id = db.Column(db.Integer, db.ForeignKey('dim_organizacijska_klasifikacija.id'))
+    programska_klasifikacija_id = db.Column(db.Integer, db.ForeignKey('dim_programska_klasifikacija.id'))
+    izvor_financiranja_id = db.Column(db.Integer, db.ForeignKey('dim_izvor_financiranja.id'))
+    ekonomska_klasifikacija_id = db.Column(db.Integer, db.ForeignKey('dim_ekonomska_klasifikacija.id'))
+    funkcijska_klasifikacija_id = db.Column(db.Integer, db.ForeignKey('dim_funkcijska_klasifikacija.id'))
+    broj_racuna = db.Column(db.String)
+    opis = db.Column(db.String)
+    datum_racuna = db.Column(db.Date)
+    datum_dospijeca = db.Column(db.Date)
+    iban = db.Column(db.String)
+    poziv_na_broj = db.Column(db.String)
+
+# isplate_flat view: same columns as isplate, joined back from the dimension tables.
+# Kept out of Base.metadata so create_all() doesn't try to create it as a table.
+FLAT_VIEW = db.Table(
+    'isplate_flat', db.MetaData(),
+    *[db.Column(c.name, c.type) for c in Isplate.__table__.columns]
+)
+FLAT_VIEW_SQL = (
+    "CREATE VIEW IF NOT EXISTS isplate_flat AS SELECT "
+    + ", ".join(
+        f"dim_{c.name}.vrijednost AS {c.name}" if c.name in DIMENSIONS else f"f.{c.name}"
+        for c in Isplate.__table__.columns
+    )
+    + " FROM isplate_fact f "
+    + " ".join(f"LEFT JOIN dim_{d} ON f.{d}_id = dim_{d}.id" for d in DIMENSIONS)
+)
+
+#----------------SUMMARY TABLES (odražavaju agregate u BigQueryju, vidi schema.AGGREGATES)-------
+class IsplateDnevno(Base):
+    __tablename__ = 'isplate_dnevno'
+    datum = db.Column(db.Date, primary_key=True)
+    broj_isplata = db.Column(db.Integer)
+    iznos = db.Column(db.Float)
+
+class IsplatePoPrimatelju(Base):
+    __tablename__ = 'isplate_po_primatelju'
+    id = db.Column(db.Integer, primary_key=True)
+    datum = db.Column(db.Date, index=True)
+    primatelj = db.Column(db.String)
+    oib = db.Column(db.String)
+    broj_isplata = db.Column(db.Integer)
+    iznos = db.Column(db.Float)
+
+class IsplatePoKlasifikaciji(Base):
+    __tablename__ = 'isplate_po_klasifikaciji'
+    id = db.Column(db.Integer, primary_key=True)
+    datum = db.Column(db.Date, index=True)
+    organizacijska_klasifikacija = db.Column(db.String)
+    programska_klasifikacija = db.Column(db.String)
+    izvor_financiranja = db.Column(db.String)
+    ekonomska_klasifikacija = db.Column(db.String)
+    funkcijska_klasifikacija = db.Column(db.String)
+    broj_isplata = db.Column(db.Integer)
+    iznos = db.Column(db.Float)
+
+AGGREGATE_MODELS = {
+    IsplateDnevno: (),
+    IsplatePoPrimatelju: ('primatelj', 'oib'),
+    IsplatePoKlasifikaciji: KLASIFIKACIJE,
+}
+
+#----------------FULL-TEXT SEARCH (SQLite FTS5, rowid = row_number)--------------------------------
+FTS_COLUMNS = ('opis', 'primatelj', 'pozicija')
+FTS_TABLE = db.Table(
+    'isplate_fts', db.MetaData(),
+    db.Column('rowid', db.Integer),
+    *[db.Column(c, db.String) for c in FTS_COLUMNS]
+)
+FTS_CREATE_SQL = f"CREATE VIRTUAL TABLE IF NOT EXISTS isplate_fts USING fts5({', '.join(FTS_COLUMNS)})"
+# NFKD leaves đ as is, so it is mapped by hand; č/ć/š/ž lose their combining marks below
+_FOLD_TABLE = str.maketrans({'đ': 'd', 'Đ': 'd'})
+
+def fold_text(value):
+    """Case- and diacritic-folded text, so that 'Čistoća' and 'cistoca' index the same."""
+    if value is None or pd.isna(value):
+        return ''
+    text = unicodedata.normalize('NFKD', str(value).translate(_FOLD_TABLE).casefold())
+    return ''.join(ch for ch in text if not unicodedata.combining(ch))
+
 class DBHandler():
-    def __init__(self):   
-        self.db_engine = db.create_engine(f"sqlite:///{DB_PATH}")
+    """SQLite mirror of isplate_master. Reads decorated with @cached_query are served from
+    self.cache until a write touches a date in their range (writes through this handler only).
+    """
+
+    def __init__(self, db_path=DB_PATH, star_schema=STAR_SCHEMA, cache_size=QUERY_CACHE_SIZE):   
+        self.db_engine = db.create_engine(f"sqlite:///{db_path}")
         Base.metadata.create_all(self.db_engine)
         Session = sessionmaker()
         Session.configure(bind=self.db_engine)
         self.session = Session()
+        self.cache = QueryCache(cache_size)
+        self.star_schema = star_schema
+        if star_schema:
+            # Rows go into the fact table, reads go through the flat view
+            self.session.execute(db.text(FLAT_VIEW_SQL))
+            self.session.commit()
+            self.store, self.src = IsplateFact, FLAT_VIEW
+            self._dim_cache = {}  # column -> {vrijednost: id}
+        else:
+            self.store, self.src = Isplate, Isplate.__table__
+        self.session.execute(db.text(FTS_CREATE_SQL))
+        self.session.commit()
+        # One-off fill of the summary tables/search index for a database created before they existed
+        if self.session.query(self.store).first():
+            if not self.session.query(IsplateDnevno).first():
+                self.rebuild_aggregates()
+            if not self.session.execute(db.select(FTS_TABLE.c.rowid).limit(1)).first():
+                self.rebuild_search_index()
+
+    def _dim_key(self, column, value):
+        """Surrogate key for a dimension value, from the in-memory dictionary (inserted on a miss)."""
+        if value is None or pd.isna(value):
+            return None
+        value = str(value)  # same text the flat String column would hold
+        if column not in self._dim_cache:
+            model = DIMENSION_MODELS[column]
+            self._dim_cache[column] = dict(self.session.query(model.vrijednost, model.id).all())
+        keys = self._dim_cache[column]
+        if value not in keys:
+            result = self.session.execute(db.insert(DIMENSION_MODELS[column]).values(vrijednost=value))
+            keys[value] = result.inserted_primary_key[0]
+        return keys[value]
+
+    @staticmethod
+    def _csv_record(row):
+        return {
+            column: pd.to_datetime(row[header]).date() if column in DATE_COLUMNS else row[header]
+            for header, column in CSV_COLUMNS.items()
+        }
 
 #-------------------------------------------------------------------------------------------------
 #------------TBL MANIPULATION--------------------------------------------------------------
 #-------------------------------------------------------------------------------------------------
-    def store_csv_data(self, csv_file_path):
+    def store_csv_data(self, csv_file_path, replace=False):
+        """Store a CSV export. With replace=True, existing rows for the dates in the file are removed first."""
         data = pd.read_csv(csv_file_path, sep=';', encoding='utf-8')
-        for _, row in data.iterrows():
-            new_record = Isplate(
-                naziv_isplatitelja=row['Naziv isplatitelja'],
-                datum=pd.to_datetime(row['Datum']).date(),
-                primatelj=row['Primatelj'],
-                oib=row['OIB'],
-                mjesto=row['Mjesto'],
-                proracunski_korisnik=row['Proračunski korisnik'],
-                valuta=row['Valuta'],
-                iznos_na_poziciji=row['Iznos na poziciji'],
-                pozicija=row['Pozicija'],
-                organizacijska_klasifikacija=row['Organizacijska klasifikacija'],
-                programska_klasifikacija=row['Programska klasifikacija'],
-                izvor_financiranja=row['Izvor financiranja'],
-                ekonomska_klasifikacija=row['Ekonomska klasifikacija'],
-                funkcijska_klasifikacija=row['Funkcijska klasifikacija'],
-                broj_racuna=row['Broj računa'],
-                opis=row['Opis'],
-                datum_racuna=pd.to_datetime(row['Datum računa']).date(),
-                datum_dospijeca=pd.to_datetime(row['Datum dospijeća']).date(),
-                iban=row['IBAN'],
-                poziv_na_broj=row['Poziv na broj']
-                )
-            self.session.add(new_record)
-        self.session.commit()
+        dates = {pd.to_datetime(d).date() for d in data['Datum'].unique()}
+        try:
+            if replace:
+                self._delete_dates(dates)
+            new_records, search_rows = [], []
+            for _, row in data.iterrows():
+                record = self._csv_record(row)
+                search_rows.append({c: fold_text(record[c]) for c in FTS_COLUMNS})
+                if self.star_schema:
+                    for column in DIMENSIONS:
+                        record[f'{column}_id'] = self._dim_key(column, record.pop(column))
+                new_record = self.store(**record)
+                self.session.add(new_record)
+                new_records.append(new_record)
+            # Flush to get row_numbers, then index them in the same transaction
+            self.session.flush()
+            for new_record, search_row in zip(new_records, search_rows):
+                search_row['rowid'] = new_record.row_number
+            if search_rows:
+                self.session.execute(db.insert(FTS_TABLE), search_rows)
+            self.session.commit()
+        except Exception:
+            # Dimension ids inserted by this ingest were rolled back with it
+            self.session.rollback()
+            if self.star_schema:
+                self._dim_cache = {}
+            raise
+        self.refresh_aggregates(dates)
         #print(f'Data from {csv_file_path} stored in the database!')
 
+    def _delete_dates(self, dates):
+        """Delete rows for the given dates and their search index entries (not committed)."""
+        row_numbers = db.select(self.store.row_number).where(self.store.datum.in_(dates))
+        self.session.execute(db.delete(FTS_TABLE).where(FTS_TABLE.c.rowid.in_(row_numbers)))
+        self.session.query(self.store).filter(self.store.datum.in_(dates)).delete(synchronize_session=False)
+
+    def delete_date(self, dt):
+        self._delete_dates([dt])
+        self.session.commit()
+        self.refresh_aggregates([dt])
+
+    def refresh_aggregates(self, dates):
+        """Recompute only the given dates' slices of the summary tables.
+        Every write (store, replace, delete) ends here, so cached reads of these dates are dropped too."""
+        dates = list(dates)
+        try:
+            self._refresh_aggregate_slices(dates)
+        finally:
+            # After the commit; also when the refresh fails, since the rows themselves changed
+            self.cache.invalidate(dates)
+
+    def _refresh_aggregate_slices(self, dates):
+        for model, cols in AGGREGATE_MODELS.items():
+            self.session.query(model).filter(model.datum.in_(dates)).delete(synchronize_session=False)
+            src = self.src.c
+            group_by = [src.datum] + [src[c] for c in cols]
+            select = db.select(
+                *group_by,
+                db.func.count().label('broj_isplata'),
+                db.func.sum(src.iznos_na_poziciji).label('iznos')
+            ).where(src.datum.in_(dates)).group_by(*group_by)
+            self.session.execute(
+                db.insert(model).from_select(['datum', *cols, 'broj_isplata', 'iznos'], select)
+            )
+        self.session.commit()
+
+    def rebuild_aggregates(self):
+        dates = [d for (d,) in self.session.query(self.store.datum).distinct()]
+        for model in AGGREGATE_MODELS:
+            self.session.query(model).delete()
+        self.refresh_aggregates(dates)
+        print('Summary tables rebuilt!')
+
+    def rebuild_search_index(self):
+        self.session.execute(db.delete(FTS_TABLE))
+        rows = self.session.execute(db.select(self.src.c.row_number, *[self.src.c[c] for c in FTS_COLUMNS]))
+        search_rows = [
+            {'rowid': row.row_number, **{c: fold_text(getattr(row, c)) for c in FTS_COLUMNS}}
+            for row in rows
+        ]
+        if search_rows:
+            self.session.execute(db.insert(FTS_TABLE), search_rows)
+        self.session.commit()
+        print('Search index rebuilt!')
+
     def empty_tbl(self):
-        self.session.query(Isplate).delete()
+        self.session.query(self.store).delete()
+        self.session.execute(db.delete(FTS_TABLE))
+        for model in AGGREGATE_MODELS:
+            self.session.query(model).delete()
         self.session.commit()
+        self.cache.clear()
         print('Table emptied!')
     
+    @cached_query
     def get_last_date(self):
-        last_date = self.session.query(db.func.max(Isplate.datum)).scalar()
+        last_date = self.session.query(db.func.max(self.store.datum)).scalar()
         return last_date
     
+    @cached_query
     def check_duplicates(self):
         """ Ovo ne radi jer ima ogroman broj duplikata što su sve zasebne uplate bez distinkcije među sobom"""
+        src = self.src.c
         duplicates = self.session.query(
-            Isplate.row_number,
-            Isplate.primatelj,
-            Isplate.iznos_na_poziciji,
-            Isplate.datum,
-            Isplate.broj_racuna,
+            src.row_number,
+            src.primatelj,
+            src.iznos_na_poziciji,
+            src.datum,
+            src.broj_racuna,
             db.func.count('*').label('count')
         ).group_by(
-            Isplate.primatelj,
-            Isplate.iznos_na_poziciji,
-            Isplate.datum,
-            Isplate.broj_racuna
+            src.primatelj,
+            src.iznos_na_poziciji,
+            src.datum,
+            src.broj_racuna
         ).having(
             db.func.count('*') > 1
         ).all()
         return duplicates
     
+    def cache_stats(self):
+        """Query cache counters: hits, misses, size, evictions, invalidations."""
+        return self.cache.stats()
+
     def read_tbl(self):
+        if self.star_schema:
+            return self.session.execute(db.select(self.src)).first()
         return self.session.query(Isplate).first()
+
+#-------------------------------------------------------------------------------------------------
+#------------ANALYTICAL READS (iz summary tablica)----------------------------------------------
+#-------------------------------------------------------------------------------------------------
+    @staticmethod
+    def _date_range(query, model, start=None, end=None):
+        if start:
+            query = query.filter(model.datum >= start)
+        if end:
+            query = query.filter(model.datum <= end)
+        return query
+
+    @cached_query
+    def get_daily_totals(self, start=None, end=None):
+        query = self.session.query(IsplateDnevno.datum, IsplateDnevno.broj_isplata, IsplateDnevno.iznos)
+        return self._date_range(query, IsplateDnevno, start, end).order_by(IsplateDnevno.datum).all()
+
+    @cached_query
+    def get_recipient_totals(self, start=None, end=None, limit=None):
+        m = IsplatePoPrimatelju
+        query = self.session.query(
+            m.primatelj, m.oib,
+            db.func.sum(m.broj_isplata).label('broj_isplata'),
+            db.func.sum(m.iznos).label('iznos')
+        )
+        query = self._date_range(query, m, start, end).group_by(m.primatelj, m.oib)
+        return query.order_by(db.desc('iznos')).limit(limit).all()
+
+    @cached_query
+    def get_classification_totals(self, column, start=None, end=None):
+        m = IsplatePoKlasifikaciji
+        col = getattr(m, column)
+        query = self.session.query(
+            col,
+            db.func.sum(m.broj_isplata).label('broj_isplata'),
+            db.func.sum(m.iznos).label('iznos')
+        )
+        return self._date_range(query, m, start, end).group_by(col).order_by(db.desc('iznos')).all()
+
+#-------------------------------------------------------------------------------------------------
+#------------FULL-TEXT SEARCH--------------------------------------------------------------------
+#-------------------------------------------------------------------------------------------------
+    @cached_query
+    def search(self, query, column=None, limit=20, offset=0):
+        """Ranked (bm25) row_numbers matching all words of query as prefixes, e.g. search('cistoc').
+        Matching ignores case and Croatian diacritics; column limits the match to opis/primatelj/pozicija.
+        """
+        if column and column not in FTS_COLUMNS:
+            raise ValueError(f"Cannot search in {column}, use one of {FTS_COLUMNS}")
+        terms = fold_text(query).replace('"', ' ').split()
+        if not terms:
+            return []
+        match = ' '.join(f'"{t}"*' for t in terms)
+        if column:
+            match = f'{column} : ({match})'
+        rows = self.session.execute(db.text(
+            "SELECT rowid FROM isplate_fts WHERE isplate_fts MATCH :match "
+            "ORDER BY rank LIMIT :limit OFFSET :offset"
+        ), {'match': match, 'limit': limit, 'offset': offset})
+        return [r.rowid for r in rows]
+
+    def get_rows(self, row_numbers):
+        """Flat rows for the given row_numbers, in the same order (e.g. a page of search results)."""
+        rows = self.session.execute(db.select(self.src).where(self.src.c.row_number.in_(row_numbers)))
+        by_id = {row.row_number: row for row in rows}
+        return [by_id[n] for n in row_numbers if n in by_id]
     
 #----------------------------------------------------------------------------------------------
 #----------------TESTING-----------------------------------------------------------------------
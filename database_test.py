@@ -0,0 +1,70 @@
+import csv
+import datetime
+import pytest
+import sqlalchemy as db
+from database import DBHandler, FTS_COLUMNS, fold_text
+from schema import CSV_COLUMNS, DATE_COLUMNS
+
+def write_csv(path, rows):
+    """Day export with the given {column: value} overrides per row."""
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f, delimiter=';')
+        writer.writerow(CSV_COLUMNS)
+        for overrides in rows:
+            row = {c: '2024-01-02' if c in DATE_COLUMNS else f'{c} x' for c in CSV_COLUMNS.values()}
+            row['iznos_na_poziciji'] = '10.5'
+            row.update(overrides)
+            writer.writerow(row[c] for c in CSV_COLUMNS.values())
+    return path
+
+@pytest.fixture
+def star_db(tmp_path):
+    handler = DBHandler(db_path=str(tmp_path / 'star.db'), star_schema=True)
+    yield handler
+    handler.session.close()
+
+@pytest.fixture
+def flat_db(tmp_path):
+    handler = DBHandler(db_path=str(tmp_path / 'flat.db'))
+    yield handler
+    handler.session.close()
+
+def test_failed_ingest_does_not_leave_rolled_back_dimension_ids(star_db, tmp_path):
+    bad = write_csv(tmp_path / 'bad.csv', [
+        {'primatelj': 'Čistoća d.o.o.'},
+        {'primatelj': 'Zagrebački holding', 'datum_racuna': 'nije datum'},
+    ])
+    with pytest.raises(Exception):
+        star_db.store_csv_data(bad)
+    good = write_csv(tmp_path / 'good.csv', [
+        {'primatelj': 'Čistoća d.o.o.'}, {'primatelj': 'Zagrebački holding'},
+    ])
+    star_db.store_csv_data(good)
+    primatelji = star_db.session.execute(db.select(star_db.src.c.primatelj)).scalars().all()
+    assert sorted(primatelji) == ['Zagrebački holding', 'Čistoća d.o.o.']
+
+@pytest.mark.parametrize('text, folded', [
+    ('Čistoća', 'cistoca'), ('ĐURĐEVAC', 'durdevac'), ('Šišmiš žuti', 'sismis zuti'), (None, ''),
+])
+def test_fold_text_drops_case_and_croatian_diacritics(text, folded):
+    assert fold_text(text) == folded
+
+def test_search_matches_prefixes_without_diacritics(flat_db, tmp_path):
+    flat_db.store_csv_data(write_csv(tmp_path / 'day.csv', [
+        {'opis': 'Odvoz otpada', 'primatelj': 'Čistoća d.o.o.'},
+        {'opis': 'Struja', 'primatelj': 'HEP'},
+    ]))
+    rows = flat_db.get_rows(flat_db.search('cistoc'))
+    assert [r.primatelj for r in rows] == ['Čistoća d.o.o.']
+    assert flat_db.search('otpad', column='opis') == flat_db.search('ČISTOĆA', column='primatelj')
+    assert flat_db.search('otpad', column='primatelj') == []
+
+@pytest.mark.parametrize('query', ['', '  ', '"', '...', '()', 'NEAR', 'AND', 'OR NOT', '(', 'a:b', '*'])
+def test_search_treats_punctuation_and_fts_operators_as_text(flat_db, query):
+    assert flat_db.search(query) == []
+
+def test_search_rejects_unknown_columns(flat_db):
+    with pytest.raises(ValueError):
+        flat_db.search('x', column='oib')
+    for column in FTS_COLUMNS:
+        assert flat_db.search('x', column=column) == []
@@ -0,0 +1,129 @@
+# log_handler.py
+import os
+import sys
+import copy
+import json
+import queue
+import logging
+import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from google.cloud import storage
+
+# ─── CONFIG ─────────────────────────────────────────────────────────────────────────
+LOG_MAX_BYTES    = int(os.getenv("LOG_MAX_BYTES", 5 * 1024 * 1024))  # per file
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", 3))              # rotated files kept
+LOG_QUEUE_SIZE   = int(os.getenv("LOG_QUEUE_SIZE", 10000))            # records in flight
+LOG_BUCKET       = os.getenv("LOG_BUCKET", "zagreb-viz-raw-csvs")     # or "" to skip upload
+CONSOLE_FORMAT   = '%(asctime)s - %(levelname)s - %(message)s'
+# Extra fields that can be passed via logger.info(..., extra={...})
+STRUCTURED_FIELDS = ("date", "stage", "duration", "attempt")
+# ────────────────────────────────────────────────────────────────────────────────────
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with the structured fields when they are set."""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value.isoformat() if hasattr(value, 'isoformat') else value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:  # already formatted by DroppingQueueHandler.prepare
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        """Merge args into the message like QueueHandler, but keep the traceback in exc_text
+        instead of appending it to the message, so the JSON file gets its own "exception" field
+        (the console Formatter still prints exc_text after the message)."""
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            record.exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class LogHandler:
+    """Queue-based logging: the scraping thread only enqueues records,
+    a background listener writes them to the console and a size-rotated JSON log file.
+    """
+
+    def __init__(self, log_file: str, level=logging.INFO):
+        self.log_file = log_file
+        self.level = level
+        self.run_id = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.listener = None
+        os.makedirs(os.path.dirname(log_file), exist_ok=True)
+
+        self.file_handler = RotatingFileHandler(
+            log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+        )
+        self.file_handler.setFormatter(JsonFormatter())
+        self.stream_handler = logging.StreamHandler()
+        self.stream_handler.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+        self.queue_handler = DroppingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+
+    def start(self):
+        """Route all root logging through the queue."""
+        root = logging.getLogger()
+        root.setLevel(self.level)
+        for h in root.handlers[:]:
+            root.removeHandler(h)
+        root.addHandler(self.queue_handler)
+        self.listener = QueueListener(
+            self.queue_handler.queue, self.file_handler, self.stream_handler,
+            respect_handler_level=True
+        )
+        self.listener.start()
+
+    def stop(self):
+        """Flush the queue, close the log file and fall back to direct console logging."""
+        if not self.listener:
+            return
+        self.listener.stop()
+        self.listener = None
+        self.file_handler.close()
+        root = logging.getLogger()
+        root.removeHandler(self.queue_handler)
+        root.addHandler(self.stream_handler)
+        if self.queue_handler.dropped:
+            logging.warning(f"Log queue was full, {self.queue_handler.dropped} records dropped.")
+
+    def log_files(self):
+        """Current log file and its rotated backups, oldest first."""
+        files = [f"{self.log_file}.{i}" for i in range(LOG_BACKUP_COUNT, 0, -1)] + [self.log_file]
+        return [f for f in files if os.path.exists(f)]
+
+    def upload_to_gcs(self, bucket_name: str = LOG_BUCKET):
+        """Stop logging and ship finished log files to gs://<bucket>/logs/<run_id>/."""
+        self.stop()
+        if not bucket_name:
+            return
+        try:
+            bucket = storage.Client(project="zagreb-viz").bucket(bucket_name)
+            for path in self.log_files():
+                blob_name = f"logs/{self.run_id}/{os.path.basename(path)}"
+                bucket.blob(blob_name).upload_from_filename(path)
+                logging.info(f"Uploaded {path} to gs://{bucket_name}/{blob_name}")
+        except Exception as e:
+            print(f"Failed to upload logs to GCS: {e}", file=sys.stderr)
@@ -0,0 +1,75 @@
+# query_cache.py
+# LRU result cache for DBHandler reads (database.py), invalidated per written date
+import inspect
+import datetime
+import functools
+from collections import OrderedDict
+
+def _as_date(value):
+    """datetime (or pandas Timestamp) -> date, so cached ranges compare with the written dates."""
+    return value.date() if isinstance(value, datetime.datetime) else value
+
+class QueryCache:
+    """LRU cache of query results. Each entry remembers the date range it read
+    (None = open-ended), so writing a date only drops the entries whose range covers it.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key -> (start, end, result)
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def get(self, key):
+        """(True, result) on a hit, (False, None) on a miss."""
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return True, self.entries[key][2]
+        self.misses += 1
+        return False, None
+
+    def put(self, key, start, end, result):
+        self.entries[key] = (start, end, result)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, dates):
+        """Drop entries whose date range contains any of the given dates."""
+        dates = [_as_date(d) for d in dates]
+        stale = [
+            key for key, (start, end, _) in self.entries.items()
+            if any((start is None or d >= start) and (end is None or d <= end) for d in dates)
+        ]
+        for key in stale:
+            del self.entries[key]
+        self.invalidations += len(stale)
+
+    def clear(self):
+        self.invalidations += len(self.entries)
+        self.entries.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries),
+                'evictions': self.evictions, 'invalidations': self.invalidations}
+
+def cached_query(method):
+    """Cache a DBHandler read in self.cache, keyed by method name and arguments.
+    Its `start`/`end` arguments (if any) are the date range used for invalidation.
+    """
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        bound = signature.bind(self, *args, **kwargs)
+        bound.apply_defaults()
+        arguments = dict(bound.arguments)
+        del arguments['self']
+        key = (method.__name__, repr(sorted(arguments.items())))
+        found, result = self.cache.get(key)
+        if not found:
+            result = method(self, *args, **kwargs)
+            self.cache.put(key, _as_date(arguments.get('start')), _as_date(arguments.get('end')), result)
+        return list(result) if isinstance(result, list) else result
+    return wrapper
@@ -0,0 +1,58 @@
+import datetime
+from query_cache import QueryCache, cached_query
+
+D1, D2, D3 = datetime.date(2024, 1, 1), datetime.date(2024, 1, 2), datetime.date(2024, 1, 3)
+
+class FakeHandler:
+    def __init__(self, cache_size=4):
+        self.cache = QueryCache(cache_size)
+        self.calls = 0
+
+    @cached_query
+    def totals(self, start=None, end=None):
+        self.calls += 1
+        return [self.calls]
+
+def test_hit_and_miss():
+    cache = QueryCache(2)
+    assert cache.get('a') == (False, None)
+    cache.put('a', None, None, 1)
+    assert cache.get('a') == (True, 1)
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+def test_lru_eviction():
+    cache = QueryCache(2)
+    cache.put('a', None, None, 1)
+    cache.put('b', None, None, 2)
+    cache.get('a')                  # b is now least recently used
+    cache.put('c', None, None, 3)
+    assert cache.get('b') == (False, None)
+    assert cache.get('a') == (True, 1) and cache.get('c') == (True, 3)
+    assert cache.stats()['evictions'] == 1
+
+def test_range_invalidation():
+    cache = QueryCache(10)
+    cache.put('jan1', D1, D1, 1)
+    cache.put('from_jan2', D2, None, 2)
+    cache.put('all', None, None, 3)
+    cache.invalidate([D3])
+    assert cache.get('jan1') == (True, 1)
+    assert cache.get('from_jan2')[0] is False and cache.get('all')[0] is False
+    assert cache.stats()['invalidations'] == 2
+
+def test_cached_query_reuses_result_until_its_dates_are_written():
+    handler = FakeHandler()
+    assert handler.totals(start=D1, end=D2) == handler.totals(D1, D2) == [1]
+    handler.cache.invalidate([D3])
+    assert handler.totals(start=D1, end=D2) == [1]
+    handler.cache.invalidate([D2])
+    assert handler.totals(start=D1, end=D2) == [2]
+
+def test_datetime_bounds_are_compared_as_dates():
+    # A datetime bound (valid for a SQLAlchemy Date column) must not break invalidation by date
+    handler = FakeHandler()
+    handler.totals(start=datetime.datetime(2024, 1, 2), end=datetime.datetime(2024, 1, 2, 12))
+    handler.cache.invalidate([D1])
+    assert handler.calls == 1 and handler.cache.stats()['size'] == 1
+    handler.cache.invalidate([datetime.datetime(2024, 1, 2, 8)])
+    assert handler.cache.stats()['size'] == 0
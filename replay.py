@@ -0,0 +1,265 @@
+# replay.py
+# Re-drive the load pipeline from already archived CSVs, without scraping, e.g.:
+#   python replay.py 2024-01-02 2024-03-31 --source csvs --concurrency 4 --local /tmp/replay
+#   python replay.py 2024-01-02 2024-03-31 --source gs://zagreb-viz-raw-csvs/raw/
+import io
+import os
+import re
+import csv
+import gzip
+import json
+import shutil
+import sqlite3
+import argparse
+import datetime
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from google.cloud import bigquery
+from bq_handler import BQHandler, TABLE, WRITE_MODE
+from csv_archive import date_from_filename, day_files
+from schema import CSV_COLUMNS, DATE_COLUMNS
+
+# BigQuery column type -> SQLite column type in the local stand-in
+SQLITE_TYPES = {"INTEGER": "INTEGER", "INT64": "INTEGER", "FLOAT": "REAL", "FLOAT64": "REAL",
+                "NUMERIC": "REAL", "BOOLEAN": "INTEGER", "BOOL": "INTEGER"}  # others: TEXT
+DATE_FORMATS = ("%d.%m.%Y.", "%d.%m.%Y", "%d.%m.%Y. %H:%M:%S")  # besides ISO 8601
+
+def master_schema():
+    """isplate_master schema for the local stand-in (the real one comes from BigQuery)."""
+    return [
+        bigquery.SchemaField(c, "DATE" if c in DATE_COLUMNS else "FLOAT" if c == "iznos_na_poziciji" else "STRING")
+        for c in CSV_COLUMNS.values()
+    ]
+
+def _parse_date(value: str) -> str:
+    try:
+        return datetime.datetime.fromisoformat(value).date().isoformat()
+    except ValueError:
+        pass
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, fmt).date().isoformat()
+        except ValueError:
+            pass
+    raise ValueError(f"Could not parse '{value}' as DATE")
+
+class _Row(dict):
+    __getattr__ = dict.__getitem__
+
+class _LocalJob:
+    def __init__(self, output_rows=None, rows=()):
+        self.output_rows, self.rows = output_rows, rows
+
+    def result(self):
+        return iter(self.rows)
+
+class LocalBigQueryClient:
+    """Stand-in for bigquery.Client backed by one SQLite file, covering what BQHandler uses:
+    tables, labels, load jobs (CSV files or objects in a LocalBucket) and its query scripts,
+    run statement by statement after a few dialect rewrites (`p.d.table` -> table,
+    @param -> :param, no PARTITION BY, CURRENT_TIMESTAMP).
+    """
+
+    def __init__(self, local_dir: str, bucket=None):
+        self.bucket = bucket
+        self.conn = sqlite3.connect(os.path.join(local_dir, "bigquery.db"),
+                                    check_same_thread=False, isolation_level=None)
+        self.lock = threading.Lock()  # one SQLite statement batch at a time (BQHandler serializes its transactions itself)
+        self.schemas = {}             # table_id -> schema of the tables created in this process
+        self.labels_path = os.path.join(local_dir, "labels.json")
+        self.labels = json.load(open(self.labels_path)) if os.path.exists(self.labels_path) else {}
+
+    def _exists(self, table_id):
+        return self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (table_id,)).fetchone()
+
+    def get_table(self, ref):
+        if ref.table_id == TABLE:
+            self.create_table(bigquery.Table(ref, schema=master_schema()), exists_ok=True)
+        table = bigquery.Table(ref, schema=self.schemas[ref.table_id])
+        table.labels = dict(self.labels.get(ref.table_id, {}))
+        return table
+
+    def create_table(self, table, exists_ok=False):
+        with self.lock:
+            if self._exists(table.table_id) and not exists_ok:
+                raise ValueError(f"Already exists: {table.table_id}")
+            columns = ", ".join(f'"{f.name}" {SQLITE_TYPES.get(f.field_type, "TEXT")}' for f in table.schema)
+            self.conn.execute(f'CREATE TABLE IF NOT EXISTS "{table.table_id}" ({columns})')
+            self.schemas.setdefault(table.table_id, list(table.schema))
+        return table
+
+    def delete_table(self, table, not_found_ok=False):
+        with self.lock:
+            if not self._exists(table.table_id) and not not_found_ok:
+                raise ValueError(f"Not found: {table.table_id}")
+            self.conn.execute(f'DROP TABLE IF EXISTS "{table.table_id}"')
+
+    def update_table(self, table, fields):
+        if "labels" in fields:
+            self.labels[table.table_id] = dict(table.labels)
+            with open(self.labels_path, "w") as f:
+                json.dump(self.labels, f)
+        return table
+
+    def query(self, sql, job_config=None):
+        params = {p.name: p.value.isoformat() if hasattr(p.value, "isoformat") else p.value
+                  for p in (job_config.query_parameters if job_config else [])}
+        sql = re.sub(r"`[\w-]+\.[\w-]+\.([\w-]+)`", r'"\1"', sql)
+        sql = re.sub(r"@(\w+)", r":\1", sql).replace("CURRENT_TIMESTAMP()", "CURRENT_TIMESTAMP")
+        sql = sql.replace(" PARTITION BY datum", "")
+        rows = []
+        with self.lock:
+            try:
+                for statement in filter(None, (s.strip() for s in sql.split(";"))):
+                    cursor = self.conn.execute(statement, {k: v for k, v in params.items() if f":{k}" in statement})
+                    if cursor.description:
+                        names = [d[0] for d in cursor.description]
+                        rows = [_Row(zip(names, r)) for r in cursor.fetchall()]
+            except Exception:
+                if self.conn.in_transaction:
+                    self.conn.execute("ROLLBACK")
+                raise
+        return _LocalJob(rows=rows)
+
+    def load_table_from_file(self, f, ref, job_config):
+        text = io.TextIOWrapper(f, encoding="utf-8", newline="")
+        reader = csv.reader(text, delimiter=job_config.field_delimiter or ",")
+        lines = list(reader)[job_config.skip_leading_rows or 0:]
+        schema = job_config.schema
+        converters = {"DATE": _parse_date, "FLOAT": float, "FLOAT64": float, "NUMERIC": float,
+                      "INTEGER": int, "INT64": int}
+        rows = [
+            [None if i >= len(line) or line[i] == "" else converters.get(field.field_type, str)(line[i])
+             for i, field in enumerate(schema)]
+            for line in lines
+        ]
+        placeholders = ", ".join("?" for _ in schema)
+        with self.lock:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(f'INSERT INTO "{ref.table_id}" VALUES ({placeholders})', rows)
+            self.conn.execute("COMMIT")
+        return _LocalJob(output_rows=len(rows))
+
+    def load_table_from_uri(self, uri, ref, job_config):
+        with self.bucket.open_uri(uri) as f:
+            return self.load_table_from_file(f, ref, job_config)
+
+class _LocalBlob:
+    def __init__(self, path: str):
+        self.path = path
+        self.metadata = None
+
+    def open(self, mode="rb", **kwargs):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        return open(self.path, mode)
+
+    def patch(self):
+        with open(self.path + ".metadata.json", "w") as f:
+            json.dump(self.metadata or {}, f)
+
+class LocalBucket:
+    """Stand-in for a GCS bucket: objects are files under local_dir/bucket."""
+
+    def __init__(self, local_dir: str, name: str = "local"):
+        self.name = name
+        self.root = os.path.join(local_dir, "bucket")
+
+    def blob(self, name: str):
+        return _LocalBlob(os.path.join(self.root, name))
+
+    def open_uri(self, uri: str):
+        path = os.path.join(self.root, uri[len(f"gs://{self.name}/"):])
+        return gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
+
+def local_handler(local_dir: str, write_mode: str = "load"):
+    """BQHandler on the local stand-ins in local_dir, so replay runs the production
+    archive → load → transaction code path without touching BigQuery or GCS."""
+    if write_mode != "load":
+        raise ValueError("The local stand-ins only support write_mode='load'")
+    os.makedirs(local_dir, exist_ok=True)
+    bucket = LocalBucket(local_dir)
+    return BQHandler(write_mode, client=LocalBigQueryClient(local_dir, bucket), bucket=bucket)
+
+def _local_days(csv_dir, start, end):
+    """(date, fetch) pairs for day files in a local folder; fetch() returns the local path."""
+    return [(date_from_filename(path), lambda path=path: path) for path in day_files(csv_dir, start, end)]
+
+def _gcs_days(uri, start, end, tmp_dir):
+    """(date, fetch) pairs for archived objects under gs://bucket/prefix (.csv or .csv.gz)."""
+    from google.cloud import storage
+    from bq_handler import PROJECT
+    bucket_name, _, prefix = uri[len("gs://"):].partition("/")
+    client = storage.Client(project=PROJECT)
+
+    def fetch(blob):
+        local_name = os.path.basename(blob.name)
+        path = os.path.join(tmp_dir, local_name)
+        blob.download_to_filename(path)
+        if local_name.endswith(".gz"):
+            with gzip.open(path, "rb") as src, open(path[:-3], "wb") as out:
+                shutil.copyfileobj(src, out)
+            os.remove(path)
+            path = path[:-3]
+        return path
+
+    days = {}
+    for blob in client.list_blobs(bucket_name, prefix=prefix or "raw/"):
+        dt = date_from_filename(blob.name[:-3] if blob.name.endswith(".gz") else blob.name)
+        if dt and (start is None or dt >= start) and (end is None or dt <= end):
+            days[dt] = lambda blob=blob: fetch(blob)
+    return sorted(days.items())
+
+def replay(start, end, source, handler, concurrency=1):
+    """Push archived days in [start, end] through a BQHandler's load_csv with `concurrency` workers.
+    Returns a stats dict with days, rows, failures, seconds, rows_per_s and jobs_per_s.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if source.startswith("gs://"):
+            days = _gcs_days(source, start, end, tmp_dir)
+        else:
+            days = _local_days(source, start, end)
+        print(f"--- Replaying {len(days)} days from {source} with {concurrency} worker(s) ---")
+
+        def run(dt, fetch):
+            return handler.load_csv(fetch(), dt)
+
+        rows, failures = 0, []
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            futures = {pool.submit(run, dt, fetch): dt for dt, fetch in days}
+            for future in as_completed(futures):
+                try:
+                    rows += future.result() or 0
+                except Exception as e:
+                    failures.append(futures[future])
+                    print(f"Replay failed for {futures[future]}: {e}")
+        seconds = time.perf_counter() - started
+    handler.flush_last_date_label()
+    jobs = len(days) - len(failures)
+    stats = {
+        "days": jobs, "rows": rows, "failures": sorted(failures), "seconds": round(seconds, 3),
+        "rows_per_s": round(rows / seconds, 1) if seconds else 0.0,
+        "jobs_per_s": round(jobs / seconds, 3) if seconds else 0.0,
+    }
+    print(f"Replayed {jobs} days, {rows} rows in {stats['seconds']} s "
+          f"({stats['rows_per_s']} rows/s, {stats['jobs_per_s']} jobs/s), {len(failures)} failed")
+    return stats
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay archived CSVs through the load pipeline.")
+    parser.add_argument("start", type=datetime.date.fromisoformat)
+    parser.add_argument("end", type=datetime.date.fromisoformat)
+    parser.add_argument("--source", default="csvs", help="local folder or gs://bucket/prefix")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--local", metavar="DIR", help="use the local BigQuery/GCS stand-ins in DIR")
+    parser.add_argument("--write-mode", choices=("load", "storage_write"),
+                        help="BQHandler write path (default: bq_handler.WRITE_MODE)")
+    args = parser.parse_args()
+
+    if args.local:
+        target = local_handler(args.local, args.write_mode or "load")
+    else:
+        target = BQHandler(write_mode=args.write_mode or WRITE_MODE)
+    replay(args.start, args.end, args.source, target, args.concurrency)
@@ -0,0 +1,51 @@
+# schema.py
+# Column names shared by the BigQuery (isplate_master) and SQLite (isplate) tables
+
+KLASIFIKACIJE = (
+    "organizacijska_klasifikacija",
+    "programska_klasifikacija",
+    "izvor_financiranja",
+    "ekonomska_klasifikacija",
+    "funkcijska_klasifikacija",
+)
+
+# Summary tables maintained per day: table name -> group-by columns (besides datum)
+AGGREGATES = {
+    "isplate_dnevno": (),
+    "isplate_po_primatelju": ("primatelj", "oib"),
+    "isplate_po_klasifikaciji": KLASIFIKACIJE,
+}
+
+# CSV export header (isplate.csv) -> column name
+CSV_COLUMNS = {
+    "Naziv isplatitelja": "naziv_isplatitelja",
+    "Datum": "datum",
+    "Primatelj": "primatelj",
+    "OIB": "oib",
+    "Mjesto": "mjesto",
+    "Proračunski korisnik": "proracunski_korisnik",
+    "Valuta": "valuta",
+    "Iznos na poziciji": "iznos_na_poziciji",
+    "Pozicija": "pozicija",
+    "Organizacijska klasifikacija": "organizacijska_klasifikacija",
+    "Programska klasifikacija": "programska_klasifikacija",
+    "Izvor financiranja": "izvor_financiranja",
+    "Ekonomska klasifikacija": "ekonomska_klasifikacija",
+    "Funkcijska klasifikacija": "funkcijska_klasifikacija",
+    "Broj računa": "broj_racuna",
+    "Opis": "opis",
+    "Datum računa": "datum_racuna",
+    "Datum dospijeća": "datum_dospijeca",
+    "IBAN": "iban",
+    "Poziv na broj": "poziv_na_broj",
+}
+DATE_COLUMNS = ("datum", "datum_racuna", "datum_dospijeca")
+
+# Long repeated strings, dictionary-encoded into dimension tables in the star-schema mode
+DIMENSIONS = (
+    "naziv_isplatitelja",
+    "proracunski_korisnik",
+    "primatelj",
+    "mjesto",
+    *KLASIFIKACIJE,
+)
@@ -16,6 +16,7 @@ from selenium.webdriver.support.wait import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import NoSuchElementException
 from bq_handler import BQHandler
+from log_handler import LogHandler
 from google.cloud import storage
 
 """ --- Configuration --- """
@@ -30,6 +31,7 @@ if PRODUCTION:
     LOG_FILE = os.path.join(LOG_DIR, "transparentnost_scraper.log")
     if SNAPSHOTS:
         SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "/tmp/snapshots")
+    ARCHIVE_PATH = None  # raw CSVs are archived to GCS by BQHandler
 else:
     # Local development: download into your OneDrive csvs folder
     MAIN_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -39,9 +41,16 @@ else:
     if SNAPSHOTS:
         SNAPSHOT_DIR = os.path.join(MAIN_DIR, "snapshots")
     CLEAN_DIR = False
+    # Single-file compressed archive of all downloaded days (see csv_archive.py)
+    ARCHIVE_PATH = os.path.join(MAIN_DIR, "archive", "isplate")
 os.makedirs(DOWNLOAD_DIR, exist_ok=True)
 if SNAPSHOTS:
     os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+# Browser recycling for long backfills: restart Chromium after N days or above an RSS threshold
+RECYCLE_EVERY_DAYS = int(os.getenv("RECYCLE_EVERY_DAYS", 60))
+RECYCLE_RSS_MB = int(os.getenv("RECYCLE_RSS_MB", 1200))
+TARGET_URL = "https://transparentnost.zagreb.hr/isplate/sc-isplate"
+BASE_XPATH = '/html/body/app-root/home-component/'
 
 """ --- Slack alerting --- """
 # Slack webhook URL (set via env var in Cloud Run or locally)
@@ -54,14 +63,9 @@ def alert_slack(message: str):
             logging.error(f"Failed to send Slack alert: {e}")
 
 """ --- Logging setup --- """
-logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(LOG_FILE, encoding='utf-8'),
-            logging.StreamHandler()
-        ]
-    )
+# Queue-based: file/console I/O runs on a listener thread, file is JSON and size-rotated
+log_handler = LogHandler(LOG_FILE)
+log_handler.start()
 logger = logging.getLogger(__name__)
 
 class GCSHandler:
@@ -91,6 +95,151 @@ class GCSHandler:
                 blob.upload_from_filename(local_path)
                 logger.info(f"Uploaded {local_path} to gs://{self.bucket_name}/{blob_name}")
 
+def _process_tree_rss_mb(root_pid):
+    """Resident memory (MB) of root_pid and all its descendants, read from /proc.
+    Returns None where /proc is not available (e.g. local Windows development)."""
+    if not os.path.isdir('/proc'):
+        return None
+    children = {}
+    for stat_file in glob.glob('/proc/[0-9]*/stat'):
+        try:
+            with open(stat_file) as f:
+                stat = f.read()
+            pid = int(stat.split(' ', 1)[0])
+            ppid = int(stat.rsplit(')', 1)[1].split()[1])  # comm may contain spaces
+            children.setdefault(ppid, []).append(pid)
+        except (OSError, ValueError, IndexError):
+            continue
+    total_kb, stack = 0, [root_pid]
+    while stack:
+        pid = stack.pop()
+        stack.extend(children.get(pid, []))
+        try:
+            with open(f'/proc/{pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total_kb += int(line.split()[1])
+                        break
+        except OSError:
+            continue
+    return total_kb / 1024
+
+class DriverManager:
+    """Owns the Chrome session for a run: creates it with the page ready for filtering
+    (cookies accepted, filter panel open), tracks the browser process tree's RSS and
+    recycles the session every RECYCLE_EVERY_DAYS days or above RECYCLE_RSS_MB.
+    """
+
+    def __init__(self, every_days=RECYCLE_EVERY_DAYS, max_rss_mb=RECYCLE_RSS_MB):
+        self.every_days = every_days
+        self.max_rss_mb = max_rss_mb
+        self.driver = None
+        self.cookies = []
+        self.days_in_session = 0
+        self.recycles = 0
+        self.peak_rss_mb = 0.0
+
+    def _create_driver(self):
+        """ --- Settings --- """
+        if not PRODUCTION:
+            from webdriver_manager.chrome import ChromeDriverManager
+            service = Service(ChromeDriverManager().install())
+            options = webdriver.ChromeOptions()
+        else:
+            service = Service('/usr/bin/chromedriver')
+            options = webdriver.ChromeOptions()
+            options.binary_location = '/usr/bin/chromium'
+
+        # 1) Set the download directory
+        options.add_experimental_option('prefs', {'download.default_directory': DOWNLOAD_DIR})
+
+        # 2) Required flags for headless Chrome in container environments
+        if HEADLESS:
+            options.add_argument('--headless=new')          # or '--headless' for older Chrome versions
+            options.add_argument('--no-sandbox')            # bypass OS security model
+            options.add_argument('--disable-dev-shm-usage') # overcome limited /dev/shm
+            options.add_argument('--disable-gpu')           # recommended for headless
+            options.add_argument('--remote-debugging-port=9222')
+            options.add_argument('--single-process')    # disable extensions
+
+        try:
+            logger.info("Creating Chrome driver...")
+            driver = webdriver.Chrome(service=service, options=options)
+        except Exception as e:
+            logger.error(f"Failed to create Chrome driver: {e}")
+            raise
+        if self.cookies:
+            # Restore cookies from the previous session so the consent banner doesn't show again
+            driver.get(TARGET_URL.split('/isplate')[0] + '/favicon.ico')
+            for cookie in self.cookies:
+                try:
+                    driver.add_cookie(cookie)
+                except Exception:
+                    pass
+        driver.get(TARGET_URL)
+        logger.info(f"Driver setup complete. Current URL: {driver.current_url}")
+        return driver
+
+    def _prepare_page(self, driver):
+        """Accept cookies (if the banner is shown) and open the filter panel and date filter."""
+        try:
+            WebDriverWait(driver, 3 if self.cookies else 10).until(EC.element_to_be_clickable(
+                (By.XPATH, BASE_XPATH + 'content/main/cookies/div/div[4]/div[4]/button')
+            )).click()
+        except Exception:
+            if not self.cookies:
+                raise
+        # Open filter panel
+        WebDriverWait(driver, 10).until(EC.element_to_be_clickable(
+            (By.XPATH, BASE_XPATH+'content/main/isplate-details-component/section/div/div/filters/button')
+        )).click()
+        # Open date filter
+        WebDriverWait(driver, 10).until(EC.element_to_be_clickable(
+            (By.XPATH, BASE_XPATH+'content/main/isplate-details-component/section/div/div/filters/div/div/div[3]/div[1]')
+        )).click()
+
+    def start(self):
+        self.driver = self._create_driver()
+        self._prepare_page(self.driver)
+        self.days_in_session = 0
+        self.rss_mb()
+        return self.driver
+
+    def rss_mb(self):
+        """Current RSS of chromedriver + browser processes (MB), also updates the run's peak."""
+        try:
+            rss = _process_tree_rss_mb(self.driver.service.process.pid)
+        except Exception:
+            rss = None
+        if rss is not None:
+            self.peak_rss_mb = max(self.peak_rss_mb, rss)
+        return rss
+
+    def day_done(self):
+        """Call after each scraped day; returns the (possibly new) driver."""
+        self.days_in_session += 1
+        rss = self.rss_mb()
+        if self.days_in_session >= self.every_days:
+            self.recycle(f"{self.days_in_session} days in session")
+        elif rss is not None and rss > self.max_rss_mb:
+            self.recycle(f"RSS {rss:.0f} MB > {self.max_rss_mb} MB")
+        return self.driver
+
+    def recycle(self, reason):
+        logger.info(f"Recycling browser session ({reason})", extra={'stage': 'recycle'})
+        try:
+            self.cookies = self.driver.get_cookies()
+        except Exception:
+            self.cookies = []
+        self.quit()
+        self.recycles += 1
+        return self.start()
+
+    def quit(self):
+        if self.driver:
+            self.driver.quit()
+            self.driver = None
+
 class TransparentnostScraper():
     def __init__(self):
         """ --- Initial settings --- """
@@ -99,10 +248,13 @@ class TransparentnostScraper():
         # Check for already downloaded dates
         #self.already_downloaded_dates = self._check_for_downloaded_dates()
         # Get the last date from BigQuery (a datetime.date)
-        last = BQHandler().get_last_date()
+        self.bq = BQHandler()
+        last = self.bq.get_last_date()
         self.last_date_tbl = last.date() if last else datetime.date(2024, 1, 1)
         logger.info(f"Last date in BigQuery: {self.last_date_tbl}")
 
+        self.loaded_dates = []    # dates loaded by the last webscrape() call
+        self.probe_mode = False   # daemon probing: a date without data yet is expected, no Slack alert
         if SNAPSHOTS: # Create a unique subdirectory for each run (always local)
             self.run_id = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
             self.snapshot_dir = os.path.join(SNAPSHOT_DIR, self.run_id)
@@ -173,41 +325,9 @@ class TransparentnostScraper():
         self.days_to_scrape = (self.end_date - self.start_date).days
         logger.info(f"--- Scraping from dates {self.start_date} to {self.end_date} ({self.days_to_scrape} days) ---")
 
-    def webscrape(self):
-        def _get_webdriver():
-            """ --- Settings --- """
-            if not PRODUCTION:
-                from webdriver_manager.chrome import ChromeDriverManager
-                service = Service(ChromeDriverManager().install())
-                options = webdriver.ChromeOptions()
-            else:
-                service = Service('/usr/bin/chromedriver')
-                options = webdriver.ChromeOptions()
-                options.binary_location = '/usr/bin/chromium'
-
-            # 1) Set the download directory
-            options.add_experimental_option('prefs', {'download.default_directory': DOWNLOAD_DIR})
-
-            # 2) Required flags for headless Chrome in container environments
-            if HEADLESS:
-                options.add_argument('--headless=new')          # or '--headless' for older Chrome versions
-                options.add_argument('--no-sandbox')            # bypass OS security model
-                options.add_argument('--disable-dev-shm-usage') # overcome limited /dev/shm
-                options.add_argument('--disable-gpu')           # recommended for headless
-                options.add_argument('--remote-debugging-port=9222')
-                options.add_argument('--single-process')    # disable extensions
-
-            try:
-                logger.info("Creating Chrome driver...")
-                driver = webdriver.Chrome(service=service, options=options)
-            except Exception as e:
-                logger.error(f"Failed to create Chrome driver: {e}")
-                raise
-            driver.get("https://transparentnost.zagreb.hr/isplate/sc-isplate")
-            logger.info(f"Driver setup complete. Current URL: {driver.current_url}")
-            return driver
-
-
+    def webscrape(self, manager=None):
+        """Scrape and load start_date..end_date. With a DriverManager passed in (daemon mode),
+        its warm browser is reused and left open for the next call."""
         def _date_filter_activated(timeout=15):
             end = time.time() + timeout
 
@@ -234,7 +354,8 @@ class TransparentnostScraper():
                     if PRODUCTION:
                         date_to_check = (current_date - datetime.timedelta(days=1)).strftime('%d.%m.%Y.')
                     if ('Datum:' in applied_filter_text) and (date_to_check in applied_filter_text):
-                        logger.info(f"2) Filter active: {repr(applied_filter_text)}")
+                        logger.info(f"2) Filter active: {repr(applied_filter_text)}",
+                                    extra={'date': current_date, 'stage': 'filter'})
                         return True
                 except:
                     pass
@@ -256,7 +377,8 @@ class TransparentnostScraper():
                 try:
                     first_date_in_tbl = driver.find_element(By.XPATH, first_date_xpath).text
                     if expected_date.strftime('%d.%m.%Y.') in first_date_in_tbl:
-                        logger.info(f"3a) Table content loaded: {repr(first_date_in_tbl)} (checked {loop_count+1} times)")
+                        logger.info(f"3a) Table content loaded: {repr(first_date_in_tbl)} (checked {loop_count+1} times)",
+                                    extra={'date': expected_date, 'stage': 'table', 'attempt': loop_count+1})
                         return True
                 except NoSuchElementException:
                     pass
@@ -269,7 +391,8 @@ class TransparentnostScraper():
                 time.sleep(1)
             # Only after timeout, decide if it's really a no-data day
             if last_content == 'Suma filtriranih stavki: 0,00':
-                logger.info(f"3a) No data for {expected_date.strftime('%d.%m.%Y.')}, likely weekend/holiday.")
+                logger.info(f"3a) No data for {expected_date.strftime('%d.%m.%Y.')}, likely weekend/holiday.",
+                            extra={'date': expected_date, 'stage': 'table', 'attempt': loop_count})
                 return False
             logger.warning(f"Table/content did not update to expected date {expected_date.strftime('%d.%m.%Y.')}")
             return False
@@ -278,23 +401,30 @@ class TransparentnostScraper():
             end = time.time() + timeout
             # Download button path
             download_xpath = base_xpath + 'content/main/isplate-details-component/section/div/div[2]/div'
+            attempt = 0
             while time.time() < end:
+                attempt += 1
                 try:
                     driver.find_element(By.XPATH, download_xpath).click()
-                    logger.info("4) Download button clicked")
+                    logger.info("4) Download button clicked",
+                                extra={'date': current_date, 'stage': 'download', 'attempt': attempt})
                     return True
                 except:
                     pass
                 time.sleep(1)
-            logger.info("4) Download button not clickable")
+            logger.info("4) Download button not clickable",
+                        extra={'date': current_date, 'stage': 'download', 'attempt': attempt})
             return False
 
         def _download_success(filename, timeout=30):
-            end = time.time() + timeout
+            start = time.time()
+            end = start + timeout
             while time.time() < end:
                 path = os.path.join(DOWNLOAD_DIR, filename)
                 if os.path.exists(path) and not os.path.exists(path + '.crdownload'):
-                    logger.info(f"5) Download completed.")
+                    logger.info(f"5) Download completed.",
+                                extra={'date': current_date, 'stage': 'download',
+                                       'duration': round(time.time() - start, 2)})
                     return True
                 time.sleep(1)
             return False
@@ -310,29 +440,22 @@ class TransparentnostScraper():
             return dest, newname
 
         driver = None
+        own_manager = manager is None
+        manager = manager or DriverManager()
+        self.loaded_dates = []
         try:
-            driver = _get_webdriver()
+            # Browser with cookies accepted and the date filter open
+            driver = manager.driver or manager.start()
             current_date = self.start_date
-            base_xpath = '/html/body/app-root/home-component/'
+            base_xpath = BASE_XPATH
             days_processed = 0
-            bq = BQHandler()
+            bq = self.bq
+            archive = None
+            if ARCHIVE_PATH:
+                from csv_archive import CsvArchive  # needs zstandard, only used locally
+                archive = CsvArchive(ARCHIVE_PATH)
             logger.info(" === Starting web scraping === ")
-
-            # Accept cookies
-            WebDriverWait(driver, 10).until(EC.element_to_be_clickable(
-                (By.XPATH, base_xpath + 'content/main/cookies/div/div[4]/div[4]/button')
-            )).click()
-            self._take_snapshot(driver, "after_cookies", current_date)
-
-            # Open filter panel
-            WebDriverWait(driver, 10).until(EC.element_to_be_clickable(
-                (By.XPATH, base_xpath+'content/main/isplate-details-component/section/div/div/filters/button')
-            )).click()
-
-            # Open date filter
-            WebDriverWait(driver, 10).until(EC.element_to_be_clickable(
-                (By.XPATH, base_xpath+'content/main/isplate-details-component/section/div/div/filters/div/div/div[3]/div[1]')
-            )).click()
+            self._take_snapshot(driver, "after_page_ready", current_date)
 
             # Date filter paths
             filter_base = base_xpath + 'content/main/isplate-details-component/section/div/div/filters/div/div/div[3]/div[2]/div/filter-input/'
@@ -342,6 +465,7 @@ class TransparentnostScraper():
             filter_xpath = base_xpath + 'content/main/isplate-details-component/section/div/div/filters/button'
 
             while current_date <= self.end_date:
+                day_start = time.time()
                 logger.info(f"1) Curr. date: {current_date.strftime('%d.%m.%Y.')}| Wkday: {current_date.strftime('%A')} | Progress: {days_processed}/{self.days_to_scrape}")
 
                 if False: # puni neovisno o tome što je skinuto
@@ -363,20 +487,30 @@ class TransparentnostScraper():
 
                 if _date_filter_activated():
                     self._take_snapshot(driver, "after_filter_activated", current_date)
-                    if _wait_for_table_or_content_date(current_date):
+                    if _wait_for_table_or_content_date(current_date, timeout=15 if self.probe_mode else 30):
                         self._take_snapshot(driver, "after_table_content", current_date)
                         if _download_click():
                             self._take_snapshot(driver, "after_download_click", current_date)
                             if _download_success('isplate.csv', 60):
                                 try:
                                     final_csv, newname = _rename_csv()
+                                    load_start = time.time()
                                     bq.load_csv(final_csv, current_date)
-                                    logger.info(f"6) Loaded into BigQuery: {newname}")
+                                    logger.info(f"6) Loaded into BigQuery: {newname}",
+                                                extra={'date': current_date, 'stage': 'load',
+                                                       'duration': round(time.time() - load_start, 2)})
+                                    self.loaded_dates.append(current_date)
                                 except Exception as e:
                                     self._take_snapshot(driver, "bq_load_error", current_date)
                                     logger.error(f"6) BQ load error for {current_date}: {e}")
                                     alert_slack(f":red_circle: BQ load failed for {current_date}\n```{traceback.format_exc()}```")
                                     raise Exception(f"Load failed for {current_date}")
+                                if archive:
+                                    # Local copy only: a failure here must not fail the loaded day
+                                    try:
+                                        archive.append_csv(final_csv, current_date)
+                                    except Exception as e:
+                                        logger.warning(f"6a) Local archive append failed for {current_date}: {e}")
                             else:
                                 self._take_snapshot(driver, "download_timeout", current_date)
                                 logger.error(f"5) Download timeout/Rename error for {current_date}")
@@ -385,11 +519,15 @@ class TransparentnostScraper():
                         else:
                             self._take_snapshot(driver, "download_not_available", current_date)
                             logger.info(f"4) Download not available for: {current_date}")
-                            alert_slack(f":red_circle: Scrape/download failed for {current_date}\n```{traceback.format_exc()}```")
+                            if not self.probe_mode:
+                                alert_slack(f":red_circle: Scrape/download failed for {current_date}\n```{traceback.format_exc()}```")
                     else:
                         self._take_snapshot(driver, "content_not_updated", current_date)
-                        logger.error(f"3a) No data or content not updated for {current_date}")
-                        alert_slack(f":red_circle: Content not updated for {current_date}")
+                        if self.probe_mode:
+                            logger.info(f"3a) No data yet for {current_date}")
+                        else:
+                            logger.error(f"3a) No data or content not updated for {current_date}")
+                            alert_slack(f":red_circle: Content not updated for {current_date}")
                 else:
                     self._take_snapshot(driver, "filter_activation_failed", current_date)
                     logger.error(f"2) Date filter activation failed for {current_date}")
@@ -399,8 +537,14 @@ class TransparentnostScraper():
                 # Re-open filter for next iteration
                 WebDriverWait(driver, 10).until(EC.element_to_be_clickable((By.XPATH, filter_xpath))).click()
                 self._take_snapshot(driver, "after_reopen_filter", current_date)
+                logger.info(f"7) Day done: {current_date.strftime('%d.%m.%Y.')}",
+                            extra={'date': current_date, 'stage': 'day',
+                                   'duration': round(time.time() - day_start, 2)})
                 current_date += datetime.timedelta(days=1)
                 days_processed += 1
+                if current_date <= self.end_date:
+                    # Restarts the browser (and restores page state) when it has grown too large
+                    driver = manager.day_done()
         
         except Exception as e:
             logger.error(f"Scraper failed: {e}")
@@ -408,11 +552,15 @@ class TransparentnostScraper():
                 self._take_snapshot(driver, "error")
             raise
         finally:
-            if driver:
+            self.bq.flush_last_date_label()
+            if driver and own_manager:
                 self._take_snapshot(driver, "final")
                 if SNAPSHOTS and PRODUCTION:
                     self.upload_snapshots()
-                driver.quit()
+                manager.quit()
+                self.peak_rss_mb = manager.peak_rss_mb
+                logger.info(f"Browser peak RSS: {manager.peak_rss_mb:.0f} MB, recycled {manager.recycles} times",
+                            extra={'stage': 'memory'})
                 logger.info("--- Web scraping completed! ---")
 
 if __name__ == '__main__':
@@ -432,5 +580,12 @@ if __name__ == '__main__':
         raise
     else:
         duration = datetime.datetime.now() - exe_start
-        logger.info(f"Execution completed in: {duration}")
-        alert_slack(f":white_check_mark: Completed in: {duration}")
\ No newline at end of file
+        logger.info(f"Execution completed in: {duration}",
+                    extra={'stage': 'run', 'duration': duration.total_seconds()})
+        alert_slack(f":white_check_mark: Completed in: {duration} | Browser peak RSS: {getattr(app, 'peak_rss_mb', 0):.0f} MB")
+    finally:
+        # Flush the log queue and ship the finished log files to GCS
+        if PRODUCTION:
+            log_handler.upload_to_gcs()
+        else:
+            log_handler.stop()
\ No newline at end of file